@@ -16,14 +16,105 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
 
-import json
+from functools import lru_cache
 
+from django.core.exceptions import ImproperlyConfigured
+
+from crypta.conf import settings
+
+
+@lru_cache(maxsize=None)
+def get_json_loads():
+    ''' orjson's loads when installed, imported on the first secret parsed '''
+    try:  # pragma: no cover
+        from orjson import loads
+    except ImportError:  # pragma: no cover
+        from json import loads
+    return loads
+
+
+class SecretTooLarge(ValueError):
+    pass
+
+
+class BaseSecretAdapter:
+    '''
+    Validates and parses the clear text of a secret. Subclasses implement
+    `parse`, raising ValueError for malformed data.
+    '''
+    max_size = None
+
+    @classmethod
+    def get_max_size(kls):
+        if kls.max_size is None:
+            return settings.SECRET_MAX_SIZE
+        return kls.max_size
+
+    @classmethod
+    def check_size(kls, data):
+        max_size = kls.get_max_size()
+        if not max_size:  # pragma: no cover
+            return
+
+        # Characters are a lower bound of the encoded size, so huge payloads
+        # are refused before paying for the encoding.
+        if len(data) > max_size or (
+                isinstance(data, str) and len(data.encode()) > max_size):
+            raise SecretTooLarge(
+                "Secret exceeds {} bytes.".format(max_size)
+            )
+
+    @classmethod
+    def parse(kls, data):  # pragma: no cover
+        return data
+
+    @classmethod
+    def load(kls, data):
+        kls.check_size(data)
+        return kls.parse(data)
 
-class JsonSecretAdapter:
     @classmethod
     def validate(kls, data):
         try:
-            json.loads(data)
+            kls.load(data)
         except ValueError:
             return False
         return True
+
+
+class JsonSecretAdapter(BaseSecretAdapter):
+    '''
+    Accepts any JSON document. Set `schema` to a JSON Schema to also
+    validate its structure (requires jsonschema).
+    '''
+    schema = None
+
+    @classmethod
+    def get_schema_validator(kls):
+        # Compiled once per adapter class and kept on the class itself
+        validator = kls.__dict__.get('_schema_validator')
+        if validator is None:
+            try:  # pragma: no cover
+                import jsonschema
+            except ImportError:  # pragma: no cover
+                raise ImproperlyConfigured(
+                    "{} declares a schema, but jsonschema isn't "
+                    "installed.".format(kls.__name__)
+                )
+            validator_class = jsonschema.validators.validator_for(kls.schema)
+            validator_class.check_schema(kls.schema)
+            validator = validator_class(kls.schema)
+            kls._schema_validator = validator
+        return validator
+
+    @classmethod
+    def parse(kls, data):
+        parsed = get_json_loads()(data)
+
+        if kls.schema is not None:
+            validator = kls.get_schema_validator()
+            error = next(validator.iter_errors(parsed), None)
+            if error is not None:
+                raise ValueError(error.message)
+
+        return parsed
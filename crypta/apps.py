@@ -23,3 +23,6 @@ from django.utils.translation import ugettext_lazy as _
 class CryptaAppConfig(AppConfig):
     name = 'crypta'
     verbose_name = _('Django-Crypta')
+
+    def ready(self):
+        from crypta import signals  # NOQA
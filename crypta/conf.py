@@ -26,9 +26,39 @@ class CryptaConf(AppConf):
     TEMPLATE_EXTENSION = "html"
     TOKEN_SIZE = 16
     DAYS_TO_EXPIRE_INVITE = 30
+    INVITE_PAGE_SIZE = 25
     SECRET_ADAPTER = 'crypta.adapters.JsonSecretAdapter'
+    SECRET_MAX_SIZE = 64 * 1024
+    SECRET_COMPRESSION = True
+    SECRET_COMPRESSION_THRESHOLD = 128
+    SECRET_PAGE_SIZE = 25
     KEY = "crypta.utils.crypt.SecretUpdateTokenGenerator"
     SECRET_TOKEN_TIMEOUT = 3 * 60
+    PASSWORD_CONFIRM_BY_KEY = True
+    REWRAP_WORKERS = None
+    REWRAP_BATCH_SIZE = 100
+    KEYRING_ENABLED = False
+    KEYRING_COOKIE_NAME = 'crypta_keyring'
+    THROTTLE_CACHE = 'default'
+    THROTTLE_BUDGET = 30
+    THROTTLE_IP_BUDGET = 300
+    THROTTLE_CLIENT_IP = 'crypta.utils.throttle.get_remote_addr'
+    THROTTLE_WINDOW = 60
+    NOTIFICATION_WINDOW = 0
+    METRICS_ENABLED = False
+    METRICS_SINKS = ()
+    METRICS_TOKEN = None
+    ASYNC_VIEWS = False
+    ASYNC_WORKERS = None
+    ACCESS_CACHE = 'default'
+    ACCESS_CACHE_TIMEOUT = 5 * 60
+    ACCESS_CACHE_MAX_VAULTS = 500
+    PRIMARY_DATABASE = 'default'
+    REPLICA_DATABASE = None
+    REPLICA_PIN_SECONDS = 10
+    QUERY_BUDGET = 15
+    QUERY_BUDGETS = {}
+    IMPORT_BUDGET = 1.0
 
     @classmethod
     def get_secret_adapter(kls):  # pragma: no cover
@@ -17,18 +17,15 @@
 # along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
 
 from django import forms
-from django.contrib.auth import get_user_model
+from django.contrib.auth import forms as auth_forms, get_user_model
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 
-from crypta import models
-from crypta.utils import crypt
+from crypta import adapters, models
+from crypta.utils import access, crypt
 from crypta.conf import settings
 from crypta.mixins import forms as mixins
 
-User = get_user_model()
-SecretAdapter = settings.get_secret_adapter()
-
 
 class UpdateVaultForm(mixins.SlugFormMixin, forms.ModelForm):
     ''' Form that updates an existing Vault '''
@@ -52,7 +49,9 @@ class CreateInviteForm(mixins.PasswordConfirmFormMixin, forms.ModelForm):
     ''' Form that creates a new invite. '''
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields['invitee'].queryset = User.objects.exclude(pk=self.user.pk)
+        self.fields['invitee'].queryset = get_user_model().objects.exclude(
+            pk=self.user.pk
+        )
 
     class Meta:
         model = models.Invite
@@ -70,9 +69,15 @@ class AcceptInviteForm(mixins.PasswordConfirmFormMixin):
     def __init__(self, *args, **kwargs):
         self.invite = kwargs.pop('invite', None)
         super().__init__(*args, **kwargs)
+        # Keys wrapped to the invitee's keyring come without a token
+        if crypt.is_wrapped_key(self.invite.temporary_key):
+            self.fields['token'].required = False
+            self.fields['token'].widget = forms.HiddenInput()
 
     def clean_token(self):
         token = self.cleaned_data['token']
+        if crypt.is_wrapped_key(self.invite.temporary_key):
+            return token
         if crypt.test_private_key_password(self.invite.temporary_key, token):
             return token
         raise ValidationError(
@@ -80,7 +85,7 @@ class AcceptInviteForm(mixins.PasswordConfirmFormMixin):
         )
 
 
-class UpdateMembershipForm(forms.ModelForm):
+class UpdateMembershipForm(mixins.VersionFormMixin, forms.ModelForm):
     def __init__(self, *args, **kwargs):
         self.user = kwargs.pop('user', None)
         self.vault = kwargs.pop('vault', None)
@@ -126,6 +131,72 @@ class UpdateMembershipForm(forms.ModelForm):
         fields = ['role']
 
 
+class BulkUpdateMembershipForm(forms.Form):
+    '''
+    Changes the role of several memberships of a vault at once, checking
+    every change against the role of `user` in that vault.
+    '''
+    def __init__(self, *args, **kwargs):
+        self.user = kwargs.pop('user', None)
+        self.vault = kwargs.pop('vault', None)
+        self.memberships = kwargs.pop('memberships', [])
+        super().__init__(*args, **kwargs)
+
+        self.user_role = access.get_role(self.user, self.vault.pk)
+        for membership in self.memberships:
+            self.fields[self.get_field_name(membership)] = forms.ChoiceField(
+                label=membership.member.first_name or membership.member,
+                choices=models.ROLES, initial=membership.role,
+                required=False,
+            )
+            self.fields[self.get_field_name(membership, 'version')] = (
+                forms.IntegerField(
+                    widget=forms.HiddenInput, initial=membership.version,
+                    required=False,
+                )
+            )
+
+    @staticmethod
+    def get_field_name(membership, prefix='role'):
+        return '{}_{}'.format(prefix, membership.pk)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        self.changes = {}
+        for membership in self.memberships:
+            field_name = self.get_field_name(membership)
+            new_role = cleaned_data.get(field_name) or membership.role
+            if new_role == membership.role:
+                continue
+
+            if self.user_role == 'member':  # pragma: no cover
+                raise ValidationError(_(
+                    "Sorry, but Members can't promote/demote other users."
+                ))
+
+            if self.user_role != 'owner' and membership.role == 'owner':
+                self.add_error(field_name, _(
+                    "Sorry, but only owners can update other owner's "
+                    "membership."
+                ))
+            elif self.user_role != 'owner' and new_role == 'owner':
+                self.add_error(field_name, _(
+                    "Sorry, but only owners can promote other members to "
+                    "owner."
+                ))
+            else:
+                version = cleaned_data.get(
+                    self.get_field_name(membership, 'version')
+                )
+                if version is not None:
+                    membership.version = version
+                self.changes[membership] = new_role
+        return cleaned_data
+
+    def save(self):
+        return models.Membership.objects.change_roles(self.changes, self.user)
+
+
 class BaseSecretForm(forms.Form):
     data = forms.CharField(widget=forms.Textarea)
 
@@ -135,7 +206,11 @@ class BaseSecretForm(forms.Form):
 
     def clean_data(self):
         data = self.cleaned_data['data']
-        if not SecretAdapter.validate(data):
+        try:
+            settings.get_secret_adapter().load(data)
+        except adapters.SecretTooLarge:
+            raise ValidationError(_("This secret is too large."))
+        except ValueError:
             raise ValidationError(_("Invalid secret format."))
 
         encrypted_data = crypt.encrypt(self.vault.pub_key, data)
@@ -165,7 +240,8 @@ class CreateSecretForm(BaseSecretForm, forms.ModelForm):
         ]
 
 
-class UpdateSecretForm(BaseSecretForm, forms.ModelForm):
+class UpdateSecretForm(mixins.VersionFormMixin, BaseSecretForm,
+                       forms.ModelForm):
     def __init__(self, *args, **kwargs):
         kwargs['vault'] = kwargs['instance'].vault
         super().__init__(*args, **kwargs)
@@ -181,3 +257,9 @@ class SecretPasswordForm(mixins.PasswordConfirmFormMixin, forms.ModelForm):
         model = models.Secret
         localized_fields = ('__all__')
         fields = ['vault']
+
+
+class PasswordChangeForm(mixins.RewrapKeysFormMixin,
+                         auth_forms.PasswordChangeForm):
+    ''' Changes the user's password along their membership keys '''
+    pass
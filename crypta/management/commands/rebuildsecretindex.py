@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django-Crypta.
+#
+# Django-Crypta is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Django-Crypta is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
+
+from django.core.management.base import BaseCommand
+
+from crypta import models
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the search index of the secret names'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        secrets = models.Secret.objects.only('id', 'name', 'vault_id')
+        total = secrets.count()
+        for start in range(0, total, batch_size):
+            models.SecretToken.objects.index(
+                secrets.order_by('pk')[start:start + batch_size],
+                batch_size=batch_size,
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Indexed {} secrets.'.format(total)
+        ))
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django-Crypta.
+#
+# Django-Crypta is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Django-Crypta is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
+
+from django.core.management.base import BaseCommand
+
+from crypta.utils import mail
+
+
+class Command(BaseCommand):
+    help = 'Sends the notifications whose coalescing window has passed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Sends every pending notification right away',
+        )
+
+    def handle(self, *args, **options):
+        sent = mail.flush_notifications(force=options['force'])
+        self.stdout.write(self.style.SUCCESS(
+            'Sent {} messages.'.format(sent)
+        ))
@@ -16,10 +16,22 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
 
-from django.db import models, transaction
+from django.apps import apps
+from django.db import IntegrityError, models, transaction
 
 from crypta import querysets
-from crypta.utils import crypt, tokens, mail
+from crypta.conf import settings
+from crypta.mixins.models import ConcurrentUpdateError
+from crypta.utils import access, crypt, tokens, mail
+from crypta.utils.search import tokenize
+
+
+class DeferredBlobsMixin:
+    ''' Leaves the `deferred_fields` binary columns out of every query '''
+    deferred_fields = ()
+
+    def get_queryset(self):
+        return super().get_queryset().defer(*self.deferred_fields)
 
 
 class BaseManager(models.Manager):
@@ -33,8 +45,15 @@ class BaseManager(models.Manager):
         return self.get_queryset().excluded()
 
 
-class VaultManager(BaseManager):
+class VaultManager(DeferredBlobsMixin, BaseManager):
     _queryset_class = querysets.VaultQuerySet
+    deferred_fields = ('pub_key',)
+
+    def with_keys(self):  # pragma: no cover
+        return super().get_queryset().with_keys()
+
+    def with_owners(self):  # pragma: no cover
+        return super().get_queryset().with_owners()
 
     def owned_by(self, user):  # pragma: no cover
         return super().get_queryset().owned_by(user)
@@ -46,8 +65,47 @@ class VaultManager(BaseManager):
         return super().get_queryset().with_member(user)
 
 
-class InviteManager(models.Manager):
+class SecretManager(DeferredBlobsMixin, models.Manager):
+    _queryset_class = querysets.SecretQuerySet
+    deferred_fields = ('data',)
+
+    def with_data(self):  # pragma: no cover
+        return super().get_queryset().with_data()
+
+    def from_vault_managed_by(self, user):  # pragma: no cover
+        return super().get_queryset().from_vault_managed_by(user)
+
+    def from_vault_with_member(self, user):  # pragma: no cover
+        return super().get_queryset().from_vault_with_member(user)
+
+
+class SecretTokenManager(models.Manager):
+    _queryset_class = querysets.SecretTokenQuerySet
+
+    def matching(self, term):  # pragma: no cover
+        return super().get_queryset().matching(term)
+
+    @transaction.atomic
+    def index(self, secrets, batch_size=500):
+        ''' (Re)builds the search tokens of `secrets` '''
+        secrets = list(secrets)
+        self.filter(secret__in=secrets).delete()
+        self.bulk_create([
+            self.model(secret=secret, vault_id=secret.vault_id, token=token)
+            for secret in secrets
+            for token in tokenize(secret.name)
+        ], batch_size=batch_size)
+
+
+class InviteManager(DeferredBlobsMixin, models.Manager):
     _queryset_class = querysets.InviteQuerySet
+    deferred_fields = ('temporary_key',)
+
+    def with_keys(self):  # pragma: no cover
+        return super().get_queryset().with_keys()
+
+    def with_status(self, now=None):  # pragma: no cover
+        return super().get_queryset().with_status(now)
 
     def pending(self):  # pragma: no cover
         return super().get_queryset().pending()
@@ -59,17 +117,31 @@ class InviteManager(models.Manager):
         return super().get_queryset().from_vault_managed_by(user)
 
     @transaction.atomic
-    def create(self, inviter, inviter_pass, invitee, role, vault, **kwargs):
-        token = tokens.random_token()
-        inviter_priv_key = vault.memberships.get(
-            member=inviter, excluded=False
-        ).priv_key
+    def create(self, inviter, inviter_pass, invitee, role, vault,
+               inviter_key=None, **kwargs):
+        if inviter_key is None:
+            inviter_key = crypt.unlock_private_key(
+                vault.memberships.with_keys().get(
+                    member=inviter, excluded=False
+                ).priv_key,
+                inviter_pass,
+            )
+
+        # Invitees with a keyring get the key wrapped to it, everyone else
+        # a copy locked with a token sent along the invite.
+        keyring = get_keyring(invitee)
+        if keyring is not None:
+            token = None
+            temporary_key = crypt.wrap_private_key(
+                keyring.pub_key, inviter_key
+            )
+        else:
+            token = tokens.random_token()
+            temporary_key = crypt.lock_private_key(inviter_key, token)
 
         invite = super().create(
             inviter=inviter, invitee=invitee, vault=vault, role=role,
-            temporary_key=crypt.change_password(
-                inviter_priv_key, inviter_pass, token
-            ), **kwargs
+            temporary_key=temporary_key, **kwargs
         )
 
         email = mail.VaultInviteEmail(
@@ -87,8 +159,12 @@ class InviteManager(models.Manager):
         return invite
 
 
-class MembershipManager(BaseManager):
+class MembershipManager(DeferredBlobsMixin, BaseManager):
     _queryset_class = querysets.MembershipQuerySet
+    deferred_fields = ('priv_key',)
+
+    def with_keys(self):  # pragma: no cover
+        return super().get_queryset().with_keys()
 
     def from_vault_managed_by(self, user):  # pragma: no cover
         return super().get_queryset().from_vault_managed_by(user)
@@ -98,7 +174,11 @@ class MembershipManager(BaseManager):
         if vault.pub_key:  # pragma: no cover
             raise Exception("This vault already has a public key!")
 
-        (priv_key, pub_key) = crypt.gen_keys(password)
+        keyring = get_keyring(owner)
+        if keyring is not None:
+            (priv_key, pub_key) = crypt.gen_wrapped_keys(keyring.pub_key)
+        else:
+            (priv_key, pub_key) = crypt.gen_keys(password)
         vault.pub_key = pub_key
         vault.save()
 
@@ -108,13 +188,205 @@ class MembershipManager(BaseManager):
         return membership
 
     @transaction.atomic
-    def create_from_invite(self, invite, token, password):
-        priv_key = crypt.change_password(
-            invite.temporary_key, token, password
+    def change_roles(self, changes, user):
+        '''
+        Applies the already validated `changes`, a {membership: new role}
+        dict, with a single UPDATE and sends one notification per member.
+        '''
+        changes = {
+            membership: role for membership, role in changes.items()
+            if membership.role != role
+        }
+        if not changes:
+            return []
+
+        # Each membership must still have the version it was validated with
+        unchanged = models.Q()
+        for membership in changes:
+            unchanged |= models.Q(pk=membership.pk, version=membership.version)
+
+        updated = self.filter(unchanged).update(
+            role=models.Case(*[
+                models.When(pk=membership.pk, then=models.Value(role))
+                for membership, role in changes.items()
+            ], output_field=models.CharField()),
+            version=models.F('version') + 1,
+        )
+        if updated != len(changes):
+            raise ConcurrentUpdateError(
+                "Memberships were changed by someone else."
+            )
+
+        # update() skips the post_save receivers, so do their work here
+        apps.get_model('crypta', 'Vault').objects.filter(
+            pk__in={membership.vault_id for membership in changes}
+        ).bump_version()
+        access.invalidate(*{membership.member_id for membership in changes})
+
+        role_names = dict(self.model._meta.get_field('role').choices)
+        notifications = {}
+        for membership, role in changes.items():
+            notifications.setdefault(membership.member, []).append({
+                'membership': membership,
+                'old_role_display': role_names[membership.role],
+                'new_role_display': role_names[role],
+                'demotion': self.model.is_demotion(membership.role, role),
+            })
+            membership.role = role
+            membership.version += 1
+
+        mail.MembershipChangesEmail.send_many([
+            (member.email, {'changes': member_changes, 'user': user})
+            for member, member_changes in notifications.items()
+        ])
+        return list(changes)
+
+    @transaction.atomic
+    def change_password(self, user, old_password, new_password):
+        '''
+        Re-wraps every password locked membership key of `user` from the old
+        to the new account password. Keys that don't open with the old one
+        (e.g. after a password reset) are left untouched and returned.
+        '''
+        memberships = self._get_password_locked(user)
+        priv_keys = crypt.change_passwords(
+            [membership.priv_key for membership in memberships],
+            old_password, new_password, workers=settings.REWRAP_WORKERS,
+            skip_invalid=True,
+        )
+
+        changed = [
+            (membership, priv_key)
+            for membership, priv_key in zip(memberships, priv_keys)
+            if priv_key is not None
+        ]
+        self._set_keys(
+            [membership for membership, _ in changed],
+            [priv_key for _, priv_key in changed],
         )
+        return [
+            membership
+            for membership, priv_key in zip(memberships, priv_keys)
+            if priv_key is None
+        ]
+
+    @transaction.atomic
+    def move_to_keyring(self, user, password, keyring_pub_key):
+        '''
+        Wraps the password locked membership keys of `user` to the public key
+        of the user's keyring instead.
+        '''
+        memberships = self._get_password_locked(user)
+        self._set_keys(memberships, crypt.wrap_private_keys(
+            [membership.priv_key for membership in memberships],
+            password, keyring_pub_key, workers=settings.REWRAP_WORKERS,
+        ))
+        return len(memberships)
+
+    def _get_password_locked(self, user):
+        return [
+            membership for membership in self.with_keys().select_for_update()
+            .filter(member=user).only('id', 'priv_key')
+            if not crypt.is_wrapped_key(membership.priv_key)
+        ]
+
+    def _set_keys(self, memberships, priv_keys):
+        # Neither roles nor anything rendered from the memberships changed,
+        # so there's no access cache or vault version to take care of.
+        batch_size = settings.REWRAP_BATCH_SIZE
+        for start in range(0, len(memberships), batch_size):
+            batch = list(zip(
+                memberships[start:start + batch_size],
+                priv_keys[start:start + batch_size],
+            ))
+            queryset = self.filter(
+                pk__in=[membership.pk for membership, _ in batch]
+            )
+            queryset.update(
+                priv_key=models.Case(*[
+                    models.When(pk=membership.pk, then=models.Value(
+                        priv_key, output_field=models.BinaryField()
+                    ))
+                    for membership, priv_key in batch
+                ], output_field=models.BinaryField()),
+                version=models.F('version') + 1,
+            )
+
+    @transaction.atomic
+    def create_from_invite(self, invite, token, password):
+        keyring = get_keyring(invite.invitee)
+        if crypt.is_wrapped_key(invite.temporary_key):
+            # Already wrapped to the invitee's keyring by the inviter
+            priv_key = invite.temporary_key
+        elif keyring is not None:
+            priv_key = crypt.wrap_private_key(
+                keyring.pub_key,
+                crypt.unlock_private_key(invite.temporary_key, token),
+            )
+        else:
+            priv_key = crypt.change_password(
+                invite.temporary_key, token, password
+            )
         instance = super().create(
             member=invite.invitee, vault=invite.vault, role=invite.role,
             priv_key=priv_key,
         )
         invite.accept()
         return instance
+
+
+class KeyringManager(models.Manager):
+    def unlock(self, user, password, create=True):
+        '''
+        Unlocks the keyring of `user`. On first use it's created and the
+        user's memberships are moved into it, unless `create` is False, in
+        which case None is returned. Raises ValueError for a wrong password.
+        '''
+        keyring = self.filter(user=user).first()
+        if keyring is not None:
+            return crypt.unlock_private_key(keyring.priv_key, password)
+        if not create:
+            return None
+        if not user.check_password(password):
+            raise ValueError("Invalid password.")
+
+        priv_key = crypt.gen_private_key()
+        pub_key = crypt.get_public_key(priv_key)
+        try:
+            with transaction.atomic():
+                self.create(
+                    user=user, pub_key=pub_key,
+                    priv_key=crypt.lock_private_key(priv_key, password),
+                )
+                apps.get_model('crypta', 'Membership').objects \
+                    .move_to_keyring(user, password, pub_key)
+        except IntegrityError:
+            # Created by another request meanwhile
+            return self.unlock(user, password, create=False)
+        return priv_key
+
+    def change_password(self, user, old_password, new_password):
+        '''
+        Re-locks the keyring of `user` with the new password. Returns None
+        if there's no keyring, False if it doesn't open with the old one.
+        '''
+        keyring = self.filter(user=user).first()
+        if keyring is None:
+            return None
+        try:
+            keyring.priv_key = crypt.change_password(
+                keyring.priv_key, old_password, new_password
+            )
+        except ValueError:
+            return False
+        keyring.save(update_fields=['priv_key'])
+        return True
+
+
+def get_keyring(user):
+    ''' The keyring of `user`, if keyrings are enabled and it has one '''
+    if not settings.KEYRING_ENABLED:
+        return None
+    return apps.get_model('crypta', 'Keyring').objects.filter(
+        user=user
+    ).first()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django-Crypta.
+#
+# Django-Crypta is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Django-Crypta is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import time
+
+from django.conf import settings as django_settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from crypta import routers
+from crypta.conf import settings
+from crypta.utils.metrics import QueryCounter
+
+try:  # pragma: no cover
+    from django.utils.deprecation import MiddlewareMixin
+except ImportError:  # pragma: no cover
+    MiddlewareMixin = object
+
+logger = logging.getLogger('crypta.queries')
+
+
+class QueryBudgetMiddleware(MiddlewareMixin):
+    '''
+    Debug only middleware that logs the number of queries of each request
+    and warns when a crypta view goes over its budget (see
+    CRYPTA_QUERY_BUDGET and CRYPTA_QUERY_BUDGETS).
+    '''
+    def __init__(self, *args, **kwargs):
+        if not django_settings.DEBUG:
+            raise MiddlewareNotUsed()
+        super().__init__(*args, **kwargs)
+
+    def process_request(self, request):
+        request._crypta_queries = QueryCounter().__enter__()
+
+    def process_response(self, request, response):
+        queries = getattr(request, '_crypta_queries', None)
+        if queries is None:  # pragma: no cover
+            return response
+        queries.__exit__(None, None, None)
+
+        match = getattr(request, 'resolver_match', None)
+        if match is None or \
+                not match.func.__module__.startswith('crypta.'):
+            logger.debug("%s %s: %d queries",
+                         request.method, request.path, queries.count)
+            return response
+
+        budget = get_query_budget(match.view_name)
+        if queries.count > budget:
+            logger.warning(
+                "%s %s (%s): %d queries, over the budget of %d",
+                request.method, request.path, match.view_name,
+                queries.count, budget,
+            )
+        else:
+            logger.debug("%s %s (%s): %d queries",
+                         request.method, request.path, match.view_name,
+                         queries.count)
+        return response
+
+
+def get_query_budget(view_name):
+    return settings.QUERY_BUDGETS.get(view_name, settings.QUERY_BUDGET)
+
+
+class ReplicaPinningMiddleware(MiddlewareMixin):
+    '''
+    Keeps the reads of a session on the primary database for
+    CRYPTA_REPLICA_PIN_SECONDS after it writes, so users read their own
+    writes while the replica catches up. Requests that may write (unsafe
+    methods) are always served by the primary. Must come after
+    SessionMiddleware.
+    '''
+    session_key = '_crypta_primary_until'
+
+    def process_request(self, request):
+        routers.reset_state()
+        pinned_until = request.session.get(self.session_key, 0)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE') or \
+                pinned_until > time.time():
+            routers.pin_to_primary()
+
+    def process_response(self, request, response):
+        if routers.has_written() and hasattr(request, 'session'):
+            request.session[self.session_key] = \
+                time.time() + settings.REPLICA_PIN_SECONDS
+        routers.reset_state()
+        return response
@@ -16,10 +16,19 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
 
+import logging
+
 from django import forms
+from django.apps import apps
+from django.db import transaction
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ValidationError
 
+from crypta.conf import settings
+from crypta.utils import crypt
+
+logger = logging.getLogger('crypta.keys')
+
 
 class SlugFormMixin(forms.Form):
     slug = forms.CharField(required=False)
@@ -40,12 +49,107 @@ class PasswordConfirmFormMixin(forms.Form):
 
     def __init__(self, *args, **kwargs):
         self.user = kwargs.pop('user', None)
+        # When the view hands over the user's membership key, unlocking it is
+        # the proof of the password, instead of a second KDF run through
+        # check_password. The unlocked key is kept for the view to use.
+        self.private_key = kwargs.pop('private_key', None)
+        self.unlocked_key = None
+        # The keyring unlocked earlier in this session, if any. Otherwise,
+        # with keyrings enabled, the password unlocks (or creates) it.
+        self.keyring_key = kwargs.pop('keyring_key', None)
+        self.keyring_unlocked = False
         super().__init__(*args, **kwargs)
+        if self.keyring_key is not None:
+            self.fields['password'].required = False
+            self.fields['password'].widget = forms.HiddenInput()
 
     def clean_password(self):
         password = self.cleaned_data['password']
-        if self.user.check_password(password):
+        if settings.KEYRING_ENABLED and self.user is not None:
+            return self.clean_password_with_keyring(password)
+
+        if self.private_key is not None and settings.PASSWORD_CONFIRM_BY_KEY:
+            try:
+                self.unlocked_key = crypt.unlock_private_key(
+                    self.private_key, password
+                )
+            except ValueError:
+                pass
+            else:
+                return password
+        elif self.user.check_password(password):
             return password
         raise ValidationError(
             _("Please, inform your password correctly!")
         )
+
+    def clean_password_with_keyring(self, password):
+        try:
+            if self.keyring_key is None:
+                self.keyring_key = apps.get_model(
+                    'crypta', 'Keyring'
+                ).objects.unlock(self.user, password)
+                self.keyring_unlocked = True
+            if self.private_key is not None:
+                self.unlocked_key = crypt.open_private_key(
+                    self.private_key, password, self.keyring_key
+                )
+        except ValueError:
+            raise ValidationError(
+                _("Please, inform your password correctly!")
+            )
+        return password
+
+
+class VersionFormMixin(forms.Form):
+    '''
+    Carries the version of the instance the user saw, so saving it fails
+    with ConcurrentUpdateError if someone changed it meanwhile.
+    '''
+    version = forms.IntegerField(widget=forms.HiddenInput, required=False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['version'].initial = self.instance.version
+
+    def clean_version(self):
+        version = self.cleaned_data['version']
+        if version is not None:
+            self.instance.version = version
+        return version
+
+
+class RewrapKeysFormMixin(forms.Form):
+    '''
+    For Django's PasswordChangeForm. Keyrings and membership keys are locked
+    with the account password, so they're re-wrapped along with it. Keys
+    that didn't open with the old password, e.g. after a password reset,
+    can't be re-wrapped: they're logged and kept in `locked_memberships`.
+    '''
+    def save(self, commit=True):
+        if not commit:  # pragma: no cover
+            return super().save(commit=False)
+
+        old_password = self.cleaned_data['old_password']
+        new_password = self.cleaned_data['new_password1']
+        with transaction.atomic():
+            user = super().save()
+            keyring_relocked = apps.get_model(
+                'crypta', 'Keyring'
+            ).objects.change_password(user, old_password, new_password)
+            self.locked_memberships = apps.get_model(
+                'crypta', 'Membership'
+            ).objects.change_password(user, old_password, new_password)
+
+        if keyring_relocked is False:
+            logger.warning(
+                "The keyring of user %s doesn't open with the old password "
+                "and wasn't re-locked.", user.pk,
+            )
+        if self.locked_memberships:
+            logger.warning(
+                "%d membership keys of user %s don't open with the old "
+                "password and weren't re-wrapped.",
+                len(self.locked_memberships), user.pk,
+            )
+        return user
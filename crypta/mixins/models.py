@@ -20,6 +20,78 @@ from django.db import models
 from crypta.utils.models import unique_slugify
 
 
+class DeferredBlobsModelMixin(models.Model):
+    '''
+    For models whose manager defers binary columns. Older Django versions
+    refresh through that manager, silently keeping stale values for the
+    blobs this instance had loaded, so those are fetched again here. Loading
+    a deferred blob only fetches that blob, leaving the other (possibly
+    modified) fields of this instance alone.
+    '''
+    def refresh_from_db(self, using=None, fields=None):
+        blobs = type(self)._default_manager.deferred_fields
+        if fields and set(fields) <= set(blobs):
+            self.__dict__.update(type(self)._base_manager.using(
+                using or self._state.db
+            ).filter(pk=self.pk).values(*fields).get())
+            return
+
+        loaded_blobs = []
+        if fields is None:
+            deferred_fields = self.get_deferred_fields()
+            loaded_blobs = [
+                name for name in blobs if name not in deferred_fields
+            ]
+
+        super().refresh_from_db(using=using, fields=fields)
+        if loaded_blobs:
+            self.__dict__.update(type(self)._base_manager.using(
+                using or self._state.db
+            ).filter(pk=self.pk).values(*loaded_blobs).get())
+
+    class Meta:
+        abstract = True
+
+
+class ConcurrentUpdateError(Exception):
+    pass
+
+
+class OptimisticLockMixin(models.Model):
+    '''
+    Updates only succeed while the row still has the `version` this instance
+    was loaded with (UPDATE ... WHERE version = n), bumping it. Otherwise
+    someone else changed the row meanwhile and ConcurrentUpdateError is
+    raised, without holding any row lock.
+    '''
+    version = models.PositiveIntegerField(default=0, editable=False)
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields,
+                   forced_update):
+        version_field = self._meta.get_field('version')
+        version = self.version
+        values = [value for value in values if value[0] is not version_field]
+        values.append((version_field, None, version + 1))
+
+        updated = super()._do_update(
+            base_qs.filter(version=version), using, pk_val, values,
+            update_fields, forced_update,
+        )
+        if not updated and base_qs.filter(pk=pk_val).exists():
+            raise ConcurrentUpdateError(
+                "{} {} was changed by someone else.".format(
+                    self._meta.object_name, pk_val
+                )
+            )
+
+        if updated:
+            self.version = version + 1
+        return updated
+
+    class Meta:
+        abstract = True
+
+
 class SoftDeleteMixin(models.Model):
     excluded = models.BooleanField(default=False)
 
@@ -16,11 +16,109 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with Django-Crypta. If not, see <http://www.gnu.org/licenses/>.
 
+import hashlib
+
 from django.contrib.auth.decorators import login_required
+from django.contrib.messages import get_messages
+from django.http import HttpResponse
+from django.views.decorators.http import condition
+
+from crypta.conf import settings
+from crypta.utils import keyring, metrics, throttle
 
 
 class LoginRequiredMixin:
     @classmethod
     def as_view(cls, **kwargs):
         view = super().as_view(**kwargs)
-        return login_required(view)
+        return login_required(metrics.instrument_view(view, cls.__name__))
+
+
+class CryptoThrottleMixin:
+    '''
+    Charges each POST `throttle_cost` expensive crypto operations (KDF runs,
+    RSA key generation) against the user and IP budgets of
+    crypta.utils.throttle, answering 429 before any of them runs.
+    '''
+    throttle_cost = 1
+
+    def post(self, request, *args, **kwargs):
+        retry_after = throttle.consume(request, self.throttle_cost)
+        if retry_after:
+            if metrics.is_enabled():
+                metrics.registry.inc('crypta_throttled_total',
+                                     view=type(self).__name__)
+            response = HttpResponse(
+                "Too many attempts, please try again later.", status=429,
+                content_type='text/plain',
+            )
+            response['Retry-After'] = str(retry_after)
+            return response
+        return super().post(request, *args, **kwargs)
+
+
+class KeyringMixin:
+    '''
+    For views confirming the password with PasswordConfirmFormMixin. Hands
+    the form the keyring unlocked earlier in the session, sparing the user
+    the password and the KDF, and keeps the one the form unlocked.
+    '''
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        if settings.KEYRING_ENABLED:
+            kwargs['keyring_key'] = keyring.recall(self.request)
+        return kwargs
+
+    def get_form(self, form_class=None):
+        form = super().get_form(form_class)
+        # The first form is the one post() validates, get_context_data() may
+        # build others just to render them.
+        if not hasattr(self, 'keyring_form'):
+            self.keyring_form = form
+        return form
+
+    def post(self, request, *args, **kwargs):
+        response = super().post(request, *args, **kwargs)
+        form = getattr(self, 'keyring_form', None)
+        if form is not None and form.keyring_unlocked:
+            keyring.remember(request, response, form.keyring_key)
+        return response
+
+
+class VaultETagMixin:
+    '''
+    Answers conditional GETs using the version of the vaults shown by the
+    view, so unchanged pages cost a single query instead of a full render.
+
+    Only changes that bump a vault version invalidate the ETag: edits to the
+    user model itself (e.g. the names of members and invitees) don't, and
+    show up once the vault changes or the browser drops its cached page.
+    '''
+    etag_allow_empty = False
+
+    def get_etag_queryset(self):  # pragma: no cover
+        raise NotImplementedError(
+            "VaultETagMixin requires a definition of get_etag_queryset()"
+        )
+
+    def get_etag_data(self):
+        return list(self.get_etag_queryset().order_by('pk').values_list(
+            'pk', 'version'
+        ))
+
+    def get_etag(self, request, *args, **kwargs):
+        data = self.get_etag_data()
+        if not data and not self.etag_allow_empty:
+            return None
+
+        key = '{}:{}:{}'.format(request.user.pk, request.GET.urlencode(), data)
+        return '"{}"'.format(hashlib.sha1(key.encode()).hexdigest())
+
+    def get(self, request, *args, **kwargs):
+        # A 304 would leave pending flash messages for some later page,
+        # len() peeks at them without marking them as shown.
+        if len(get_messages(request)):
+            return super().get(request, *args, **kwargs)
+
+        view = condition(etag_func=self.get_etag)(super().get)
+        return view(request, *args, **kwargs)
@@ -20,7 +20,7 @@ import uuid
 import binascii
 
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
@@ -42,13 +42,22 @@ ROLES = (
 
 ROLES_MAP = dict(ROLES)
 
+INVITE_STATUSES = (
+    ("pending", _("Pending")),
+    ("expired", _("Expired")),
+    ("accepted", _("Accepted")),
+)
+
+INVITE_STATUSES_MAP = dict(INVITE_STATUSES)
 
-class Vault(mixins.SoftDeleteMixin):
+
+class Vault(mixins.DeferredBlobsModelMixin, mixins.SoftDeleteMixin):
     name = models.CharField(max_length=100, verbose_name=_("Vault Name"))
     pub_key = models.BinaryField(blank=False, null=False)
     slug = models.SlugField(
         max_length=100, db_index=True, unique=True, blank=False, null=False
     )
+    version = models.PositiveIntegerField(default=0, editable=False)
     members = models.ManyToManyField(
         settings.AUTH_USER_MODEL, through='Membership',
         through_fields=('vault', 'member'),
@@ -68,17 +77,38 @@ class Vault(mixins.SoftDeleteMixin):
         if not self.slug:
             self.slug = unique_slugify(self.name, type(self))
 
+        # The version is only ever changed through bump_version(), never
+        # written back from a (possibly stale) instance.
+        if self.pk is not None and not kwargs.get('force_insert') \
+                and kwargs.get('update_fields') is None:
+            deferred_fields = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'version'
+                if field.attname not in deferred_fields
+            ]
+
         super().save(*args, **kwargs)
 
+    def bump_version(self):
+        type(self).objects.filter(pk=self.pk).bump_version()
+
     def get_absolute_url(self):
         return reverse('vault:detail', kwargs={'slug': self.slug})
 
     @property
     def owner(self):
+        if hasattr(self, 'owner_memberships'):
+            owners = self.owners
+            return owners[0] if owners else None
         return self.owners.first()
 
     @property
     def owners(self):
+        # Prefetched by VaultQuerySet.with_owners()
+        if hasattr(self, 'owner_memberships'):
+            return [membership.member for membership in self.owner_memberships]
+
         return self.members.filter(
             membership__vault=self, membership__role='owner'
         ).order_by('membership__joined_on')
@@ -87,10 +117,11 @@ class Vault(mixins.SoftDeleteMixin):
         return _("Vault({0.name}:{0.slug})").format(self)
 
 
-class Secret(models.Model):
+class Secret(mixins.OptimisticLockMixin, mixins.DeferredBlobsModelMixin):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=100)
     data = models.BinaryField(blank=False, null=False)
+    data_digest = models.CharField(max_length=64, blank=True, editable=False)
     created_on = models.DateTimeField(auto_now_add=True)
     updated_on = models.DateTimeField(auto_now=True)
     vault = models.ForeignKey(
@@ -99,15 +130,74 @@ class Secret(models.Model):
         related_query_name="secret",
     )
 
+    objects = managers.SecretManager()
+
     class Meta:
         default_permissions = ()
         verbose_name = _("Secret")
         verbose_name_plural = _("Secrets")
+        index_together = ('vault', 'name', 'id')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The search tokens only need rebuilding when the name changes
+        instance._loaded_name = instance.__dict__.get('name')
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        if fields is None or 'name' in fields:
+            self._loaded_name = self.name
+
+    @property
+    def name_changed(self):
+        return self.name != getattr(self, '_loaded_name', None)
+
+    def save(self, *args, **kwargs):
+        # A deferred ciphertext wasn't changed, neither was its digest
+        if 'data' not in self.get_deferred_fields():
+            self.data_digest = crypt.digest(self.data)
+        super().save(*args, **kwargs)
+        self._loaded_name = self.name
 
     @property
     def hex_data(self):
         return binascii.hexlify(self.data)
 
+    def get_data_digest(self):
+        # Rows written before data_digest existed are hashed once and the
+        # digest stored, unless somebody already did it meanwhile.
+        if not self.data_digest:
+            self.data_digest = crypt.digest(self.data)
+            if self.pk is not None:
+                type(self).objects.filter(pk=self.pk, data_digest='').update(
+                    data_digest=self.data_digest
+                )
+        return self.data_digest
+
+    def upgrade_data(self, clear_text):
+        '''
+        Re-encrypts a ciphertext written in an older format. The row is only
+        written after commit and only if nobody changed it meanwhile.
+        '''
+        if not crypt.needs_upgrade(self.vault.pub_key, self.data):
+            return False
+
+        old_digest = self.get_data_digest()
+        self.data = crypt.encrypt(self.vault.pub_key, clear_text)
+        self.data_digest = crypt.digest(self.data)
+
+        queryset = type(self).objects.filter(
+            models.Q(data_digest=old_digest) | models.Q(data_digest=''),
+            pk=self.pk,
+        )
+        data, data_digest = self.data, self.data_digest
+        transaction.on_commit(
+            lambda: queryset.update(data=data, data_digest=data_digest)
+        )
+        return True
+
     def get_absolute_url(self):
         return reverse('secret:detail', args=[self.pk])
 
@@ -115,15 +205,43 @@ class Secret(models.Model):
         return _("Secret({0.name}@{0.vault})").format(self)
 
 
-class Invite(models.Model):
+class SecretToken(models.Model):
+    ''' Normalized words of a secret's name, indexed for searching. '''
+    secret = models.ForeignKey(
+        Secret, on_delete=models.CASCADE,
+        related_name="tokens",
+        related_query_name="token",
+    )
+    vault = models.ForeignKey(
+        Vault, on_delete=models.CASCADE,
+        related_name="+",
+    )
+    token = models.CharField(max_length=100)
+
+    objects = managers.SecretTokenManager()
+
+    class Meta:
+        default_permissions = ()
+        verbose_name = _("Secret Token")
+        verbose_name_plural = _("Secret Tokens")
+        index_together = (
+            ('token', 'vault'),
+            ('vault', 'token'),
+        )
+
+    def __str__(self):
+        return _("SecretToken({0.token}@{0.secret_id})").format(self)
+
+
+class Invite(mixins.DeferredBlobsModelMixin):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     inviter = models.ForeignKey(
-        settings.AUTH_USER_MODEL,
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
         related_name="vault_inviters",
         related_query_name="vault_inviter",
     )
     invitee = models.ForeignKey(
-        settings.AUTH_USER_MODEL,
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
         related_name="vault_invitees",
         related_query_name="vault_invitee",
     )
@@ -172,15 +290,20 @@ class Invite(models.Model):
         self.expires_on = get_invite_expires_on()
         self.save()
 
-    def resend(self, inviter, password):
-        token = tokens.random_token()
-        inviter_priv_key = self.vault.memberships.get(
-            member=inviter, excluded=False
-        ).priv_key
-
-        self.temporary_key = crypt.change_password(
-            inviter_priv_key, password, token
-        )
+    def resend(self, inviter, password, inviter_key=None):
+        # Keys wrapped to the invitee's keyring need no new token
+        if crypt.is_wrapped_key(self.temporary_key):
+            token = None
+        else:
+            token = tokens.random_token()
+            if inviter_key is None:
+                inviter_key = crypt.unlock_private_key(
+                    self.vault.memberships.with_keys().get(
+                        member=inviter, excluded=False
+                    ).priv_key,
+                    password,
+                )
+            self.temporary_key = crypt.lock_private_key(inviter_key, token)
 
         email = mail.VaultInviteEmail(
             to=self.invitee.email,
@@ -202,6 +325,10 @@ class Invite(models.Model):
 
     @property
     def days_to_expire(self):
+        # Annotated by InviteQuerySet.with_status()
+        if hasattr(self, 'days_left'):
+            return self.days_left
+
         if self.accepted:
             return 0
 
@@ -212,6 +339,9 @@ class Invite(models.Model):
 
     @property
     def status(self):
+        if hasattr(self, 'status_code'):
+            return INVITE_STATUSES_MAP[self.status_code]
+
         if self.accepted:
             return _("Accepted")
 
@@ -224,7 +354,8 @@ class Invite(models.Model):
         return _("Invite({0.inviter}->{0.invitee}@{0.vault})").format(self)
 
 
-class Membership(mixins.SoftDeleteMixin):
+class Membership(mixins.OptimisticLockMixin,
+                 mixins.DeferredBlobsModelMixin, mixins.SoftDeleteMixin):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     member = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
@@ -248,14 +379,18 @@ class Membership(mixins.SoftDeleteMixin):
         verbose_name_plural = _("Memberships")
         unique_together = ('member', 'vault')
 
+    @staticmethod
+    def is_demotion(old_role, new_role):
+        return (old_role == 'owner') \
+            or (old_role == 'admin' and new_role == 'member')
+
     def change_role(self, old_role, user, commit=True):
         if not commit:  # pragma: no cover
             return
         self.save()
 
         mail_class = mail.MembershipPromotionEmail
-        if (old_role == 'owner') \
-                or (old_role == 'admin' and self.role == 'member'):
+        if self.is_demotion(old_role, self.role):
             mail_class = mail.MembershipDemotionEmail
 
         email = mail_class(
@@ -271,3 +406,46 @@ class Membership(mixins.SoftDeleteMixin):
 
     def __str__(self):
         return _("Membership({0.member}@{0.vault.slug}:{0.role})").format(self)
+
+
+class Keyring(models.Model):
+    '''
+    A user's own keypair, locked with the account password. Memberships of
+    users with a keyring store the vault key wrapped to its public key.
+    '''
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+        related_name="crypta_keyring",
+    )
+    pub_key = models.BinaryField(blank=False, null=False)
+    priv_key = models.BinaryField(blank=False, null=False)
+    created_on = models.DateTimeField(auto_now_add=True)
+
+    objects = managers.KeyringManager()
+
+    class Meta:
+        default_permissions = ()
+        verbose_name = _("Keyring")
+        verbose_name_plural = _("Keyrings")
+
+    def __str__(self):
+        return _("Keyring({0.user})").format(self)
+
+
+class Notification(models.Model):
+    ''' A rendered email waiting to be sent along its recipient's others '''
+    recipient = models.EmailField()
+    from_addr = models.CharField(max_length=254, blank=True)
+    subject = models.CharField(max_length=255)
+    text = models.TextField(blank=True)
+    html = models.TextField(blank=True)
+    created_on = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        default_permissions = ()
+        verbose_name = _("Notification")
+        verbose_name_plural = _("Notifications")
+        index_together = ('recipient', 'created_on')
+
+    def __str__(self):
+        return _("Notification({0.subject}->{0.recipient})").format(self)
@@ -16,9 +16,16 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with Django-Crypta. If not, see <http://www.gnu.org/licenses/>.
 
+from datetime import timedelta
+
+from django.apps import apps
 from django.db import models
 from django.utils import timezone
 
+from crypta.conf import settings
+from crypta.utils import access
+from crypta.utils.search import tokenize
+
 
 class BaseQuerySet(models.QuerySet):
     def active(self):
@@ -29,35 +36,146 @@ class BaseQuerySet(models.QuerySet):
 
 
 class VaultQuerySet(BaseQuerySet):
+    # Each lookup first tries the cached vault access of the user
+    # (crypta.utils.access) and only joins through Membership without it.
     def owned_by(self, user):
+        vault_ids = access.get_vault_ids(user, roles=('owner',))
+        if vault_ids is not None:
+            return self.filter(pk__in=vault_ids)
+
         return self.filter(
             membership__member=user, membership__role='owner'
         )
 
     def managed_by(self, user):
+        vault_ids = access.get_vault_ids(user, roles=('owner', 'admin'))
+        if vault_ids is not None:
+            return self.filter(pk__in=vault_ids)
+
         return self.filter(
             membership__member=user, membership__role__in=('owner', 'admin')
         )
 
     def with_member(self, user):
+        vault_ids = access.get_vault_ids(user, active_membership=True)
+        if vault_ids is not None:
+            return self.filter(pk__in=vault_ids)
+
         return self.filter(
             membership__member=user, membership__excluded=False
         )
 
+    def with_keys(self):
+        return self.defer(None)
+
+    def with_owners(self):
+        '''
+        Prefetches the owners of all vaults in one query, which Vault.owner
+        and Vault.owners then use instead of querying per vault.
+        '''
+        Membership = apps.get_model('crypta', 'Membership')
+        return self.prefetch_related(models.Prefetch(
+            'memberships',
+            queryset=Membership.objects.filter(
+                role='owner'
+            ).select_related('member').order_by('joined_on'),
+            to_attr='owner_memberships',
+        ))
+
+    def bump_version(self):
+        return self.update(version=models.F('version') + 1)
+
 
 class BaseManagedVaultQuerySet(BaseQuerySet):
     def from_vault_managed_by(self, user):
+        vault_ids = access.get_vault_ids(user, roles=('owner', 'admin'))
+        if vault_ids is not None:
+            return self.filter(vault_id__in=vault_ids)
+
         return self.filter(
             vault__membership__member=user,
             vault__membership__role__in=('owner', 'admin'),
         )
 
+    def from_vault_with_member(self, user):
+        vault_ids = access.get_vault_ids(user)
+        if vault_ids is not None:
+            return self.filter(vault_id__in=vault_ids)
+
+        return self.filter(vault__membership__member=user)
+
 
 class MembershipQuerySet(BaseManagedVaultQuerySet):
-    pass
+    def with_keys(self):
+        return self.defer(None)
+
+
+class SecretQuerySet(BaseManagedVaultQuerySet):
+    def with_data(self):
+        return self.defer(None)
+
+    def search(self, query, vault=None, vaults=None):
+        '''
+        Secrets whose name has words starting with every term of `query`,
+        none if it has no words. Passing `vault`, or the pks of `vaults`,
+        narrows the token lookups to their index entries.
+        '''
+        terms = tokenize(query)
+        if not terms:
+            return self.none()
+
+        SecretToken = apps.get_model('crypta', 'SecretToken')
+        queryset = self
+        for term in terms:
+            tokens = SecretToken.objects.matching(term)
+            if vault is not None:
+                tokens = tokens.filter(vault=vault)
+            elif vaults is not None:
+                tokens = tokens.filter(vault__in=vaults)
+            queryset = queryset.filter(pk__in=tokens.values('secret_id'))
+        return queryset
+
+
+class SecretTokenQuerySet(models.QuerySet):
+    def matching(self, term):
+        # A range instead of startswith so every backend uses the index
+        return self.filter(token__gte=term, token__lt=term + '\uffff')
 
 
 class InviteQuerySet(BaseManagedVaultQuerySet):
+    def with_keys(self):
+        return self.defer(None)
+
+    def with_status(self, now=None):
+        '''
+        Annotates `status_code` ('accepted', 'expired' or 'pending') and
+        `days_left`, the days to expire, so both can be filtered and sorted.
+        Invites never expire beyond DAYS_TO_EXPIRE_INVITE days, which bounds
+        the days buckets.
+        '''
+        now = now or timezone.now()
+        max_days = settings.DAYS_TO_EXPIRE_INVITE
+        return self.annotate(
+            status_code=models.Case(
+                models.When(accepted=True, then=models.Value('accepted')),
+                models.When(expires_on__lt=now, then=models.Value('expired')),
+                default=models.Value('pending'),
+                output_field=models.CharField(),
+            ),
+            days_left=models.Case(
+                models.When(accepted=True, then=models.Value(0)),
+                *[
+                    models.When(
+                        expires_on__gte=now + timedelta(days=days),
+                        then=models.Value(days),
+                    )
+                    for days in range(max_days, 0, -1)
+                ],
+                default=models.Value(0),
+                output_field=models.IntegerField()
+            ),
+        )
+
     def pending(self):
         return self.filter(accepted=False).filter(
             expires_on__gte=timezone.now()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django-Crypta.
+#
+# Django-Crypta is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Django-Crypta is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+
+from crypta.conf import settings
+
+try:  # pragma: no cover
+    from contextvars import ContextVar
+except ImportError:  # pragma: no cover
+    ContextVar = None  # Python < 3.7, threads only
+
+
+class RoutingState:
+    ''' Whether the current request is pinned to the primary and wrote '''
+    def __init__(self):
+        self.pinned = False
+        self.written = False
+
+
+# The state of each request is a fresh RoutingState set by reset_state().
+# Holding it in a context variable, the work an async view hands to an
+# executor (under a copy of the context) shares the very same object, so
+# pinning and writes on worker threads count for the request.
+if ContextVar is not None:
+    _state = ContextVar('crypta_routing_state', default=None)
+else:  # pragma: no cover
+    _local = threading.local()
+
+    class _ThreadState:
+        def get(self):
+            return getattr(_local, 'state', None)
+
+        def set(self, state):
+            _local.state = state
+
+    _state = _ThreadState()
+
+
+def get_state():
+    state = _state.get()
+    if state is None:
+        state = RoutingState()
+        _state.set(state)
+    return state
+
+
+def pin_to_primary():
+    get_state().pinned = True
+
+
+def is_pinned():
+    return get_state().pinned
+
+
+def has_written():
+    return get_state().written
+
+
+def reset_state():
+    _state.set(RoutingState())
+
+
+class ReplicaRouter:
+    '''
+    Sends reads of crypta models to CRYPTA_REPLICA_DATABASE and writes to
+    CRYPTA_PRIMARY_DATABASE. Reads stay on the primary while pinned, see
+    crypta.middleware.ReplicaPinningMiddleware.
+    '''
+    def _is_crypta(self, model):
+        return model._meta.app_label == 'crypta'
+
+    def db_for_read(self, model, **hints):
+        if not self._is_crypta(model) or not settings.REPLICA_DATABASE:
+            return None
+
+        if is_pinned():
+            return settings.PRIMARY_DATABASE
+        return settings.REPLICA_DATABASE
+
+    def db_for_write(self, model, **hints):
+        if not self._is_crypta(model):
+            return None
+
+        get_state().written = True
+        return settings.PRIMARY_DATABASE
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = (settings.PRIMARY_DATABASE, settings.REPLICA_DATABASE)
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db == settings.REPLICA_DATABASE:
+            return False
+        return None
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django-Crypta.
+#
+# Django-Crypta is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Django-Crypta is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from crypta import models
+from crypta.utils import access
+
+
+@receiver(post_save, sender=models.Vault)
+def bump_vault_version(sender, instance, created, **kwargs):
+    if not created:
+        instance.bump_version()
+
+
+@receiver(post_save, sender=models.Secret)
+@receiver(post_delete, sender=models.Secret)
+@receiver(post_save, sender=models.Invite)
+@receiver(post_delete, sender=models.Invite)
+@receiver(post_save, sender=models.Membership)
+@receiver(post_delete, sender=models.Membership)
+def bump_parent_vault_version(sender, instance, **kwargs):
+    models.Vault.objects.filter(pk=instance.vault_id).bump_version()
+
+
+@receiver(post_save, sender=models.Membership)
+@receiver(post_delete, sender=models.Membership)
+def invalidate_member_access(sender, instance, **kwargs):
+    access.invalidate(instance.member_id)
+
+
+@receiver(post_save, sender=models.Vault)
+@receiver(post_delete, sender=models.Vault)
+def invalidate_vault_access(sender, instance, **kwargs):
+    access.invalidate_vault(instance.pk)
+
+
+@receiver(post_save, sender=models.Secret)
+def index_secret_name(sender, instance, created, update_fields=None,
+                      **kwargs):
+    if update_fields is not None and 'name' not in update_fields:
+        return
+    if created or instance.name_changed:
+        models.SecretToken.objects.index([instance])
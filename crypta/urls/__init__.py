@@ -27,6 +27,7 @@ urlpatterns = [
     url(r'^secret/', include('crypta.urls.secret', namespace="secret")),
     url(r'^membership/', include('crypta.urls.membership',
                                  namespace="membership")),
+    url(r'^metrics/', include('crypta.urls.metrics', namespace="metrics")),
 ]
 
-__all__ = ["secret", "vault", "invite", "membership"]
+__all__ = ["secret", "vault", "invite", "membership", "metrics"]
@@ -23,6 +23,8 @@ except ImportError:  # pragma: no cover
 
 from crypta import views
 
+app_name = 'invite'
+
 urlpatterns = [
     url(
         r'^vault/(?P<slug>[\w-]+)/invite$',
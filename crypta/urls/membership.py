@@ -23,12 +23,19 @@ except ImportError:  # pragma: no cover
 
 from crypta import views
 
+app_name = 'membership'
+
 urlpatterns = [
     url(
         r'^vault/(?P<slug>[\w-]+)/$',
         views.VaultMembershipListView.as_view(),
         name="by-vault"
     ),
+    url(
+        r'^vault/(?P<slug>[\w-]+)/update$',
+        views.MembershipBulkUpdateView.as_view(),
+        name="bulk-update"
+    ),
     url(
         r'^delete$',
         views.MembershipDeleteView.as_view(),
@@ -23,11 +23,21 @@ except ImportError:  # pragma: no cover
 
 from crypta import views
 
+app_name = 'secret'
+
 urlpatterns = [
     url(r'^vault/(?P<slug>[\w-]+)/create$',
         views.SecretCreateView.as_view(),
         name="create"
         ),
+    url(r'^search$',
+        views.SecretSearchView.as_view(),
+        name="search"
+        ),
+    url(r'^vault/(?P<slug>[\w-]+)/search$',
+        views.SecretSearchView.as_view(),
+        name="search-vault"
+        ),
     url(r'^(?P<pk>[0-9a-f-]+)$',
         views.SecretDetailView.as_view(),
         name="detail"
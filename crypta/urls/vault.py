@@ -23,6 +23,8 @@ except ImportError:  # pragma: no cover
 
 from crypta import views
 
+app_name = 'vault'
+
 urlpatterns = [
     # Vaults URLs
     url(
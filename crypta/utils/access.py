@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django-Crypta.
+#
+# Django-Crypta is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Django-Crypta is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
+
+from django.apps import apps
+from django.core.cache import caches
+from django.db import transaction
+
+from crypta.conf import settings
+
+
+def get_cache():
+    return caches[settings.ACCESS_CACHE]
+
+
+def get_cache_key(user_pk):
+    return 'crypta:access:{}'.format(user_pk)
+
+
+def get_vault_access(user):
+    '''
+    Returns the cached map of `{vault_pk: (role, excluded, vault_excluded)}`
+    with every membership of `user`, building it on a miss.
+    '''
+    if user.pk is None:  # pragma: no cover
+        return {}
+
+    key = get_cache_key(user.pk)
+    access = get_cache().get(key)
+    if access is None:
+        # This map grants access, so it's never built from a lagging replica
+        Membership = apps.get_model('crypta', 'Membership')
+        memberships = Membership.objects.db_manager(
+            settings.PRIMARY_DATABASE
+        ).filter(member=user)
+        access = {
+            vault_pk: (role, excluded, vault_excluded)
+            for (vault_pk, role, excluded, vault_excluded)
+            in memberships.values_list(
+                'vault_id', 'role', 'excluded', 'vault__excluded'
+            )
+        }
+        get_cache().set(key, access, settings.ACCESS_CACHE_TIMEOUT)
+    return access
+
+
+def get_vault_ids(user, roles=None, active_membership=False):
+    '''
+    Lists the pks of the vaults `user` is a member of, optionally limited to
+    `roles` and to not excluded memberships. Returns None when there are
+    more than CRYPTA_ACCESS_CACHE_MAX_VAULTS, in which case joining through
+    Membership is cheaper than a huge IN clause.
+    '''
+    access = get_vault_access(user)
+    if len(access) > settings.ACCESS_CACHE_MAX_VAULTS:
+        return None
+
+    return [
+        vault_pk for (vault_pk, (role, excluded, _)) in access.items()
+        if roles is None or role in roles
+        if not (active_membership and excluded)
+    ]
+
+
+def get_role(user, vault_pk):
+    return get_vault_access(user).get(vault_pk, (None,))[0]
+
+
+def invalidate(*user_pks):
+    keys = [get_cache_key(pk) for pk in user_pks]
+    get_cache().delete_many(keys)
+    # A concurrent request may rebuild the map before the transaction that
+    # changed it commits, so it's dropped again afterwards.
+    transaction.on_commit(lambda: get_cache().delete_many(keys))
+
+
+def invalidate_vault(vault_pk):
+    Membership = apps.get_model('crypta', 'Membership')
+    invalidate(*Membership.objects.filter(vault_id=vault_pk).values_list(
+        'member_id', flat=True
+    ))
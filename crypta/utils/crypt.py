@@ -17,34 +17,57 @@
 # along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
 
 import binascii
+import hashlib
 import os
-
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import padding, rsa
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 
 from crypta.conf import settings
+from crypta.utils import metrics
+
+# Ciphertexts start with MAGIC, a format version and a flags byte. Blobs
+# without it are raw RSA-OAEP ciphertexts from older releases (version 0).
+HEADER_MAGIC = b'CR'
+HEADER_SIZE = len(HEADER_MAGIC) + 2
+FORMAT_VERSION = 2
+FLAG_COMPRESSED = 0x01
+NONCE_SIZE = 12
 
+# The cryptography modules are imported on first use, so importing crypta
+# (e.g. for management commands) doesn't pay for loading OpenSSL bindings.
 
+
+@metrics.timed('crypta_crypt', operation='gen_keys')
 def gen_keys(passphrase):
-    if isinstance(passphrase, str):  # pragma: no cover
-        passphrase = passphrase.encode()
+    priv_key = gen_private_key()
+    return (lock_private_key(priv_key, passphrase), get_public_key(priv_key))
 
-    priv_key = rsa.generate_private_key(
-        public_exponent=65537, key_size=2048, backend=default_backend()
+
+@metrics.timed('crypta_crypt', operation='gen_wrapped_keys')
+def gen_wrapped_keys(public_key):
+    ''' Like gen_keys(), but the private key is wrapped to `public_key` '''
+    priv_key = gen_private_key()
+    return (
+        wrap_private_key(public_key, priv_key), get_public_key(priv_key)
     )
-    priv_key_bin = priv_key.private_bytes(
-        encoding=serialization.Encoding.PEM,
-        format=serialization.PrivateFormat.TraditionalOpenSSL,
-        encryption_algorithm=serialization.BestAvailableEncryption(passphrase),
+
+
+def gen_private_key():
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    return rsa.generate_private_key(
+        public_exponent=65537, key_size=2048, backend=default_backend()
     )
 
-    pub_key = priv_key.public_key()
-    pub_key_bin = pub_key.public_bytes(
+
+def get_public_key(priv_key):
+    from cryptography.hazmat.primitives import serialization
+
+    return priv_key.public_key().public_bytes(
         encoding=serialization.Encoding.PEM,
         format=serialization.PublicFormat.PKCS1,
     )
-    return (priv_key_bin, pub_key_bin)
 
 
 # def extract_pub_key(private_key, password):
@@ -65,50 +88,241 @@ def gen_keys(passphrase):
 #     return pub_key_bin
 
 
-def encrypt(public_key, secret):
+def _compress(secret):
+    if not settings.SECRET_COMPRESSION or \
+            len(secret) < settings.SECRET_COMPRESSION_THRESHOLD:
+        return (secret, 0)
+
+    compressed = zlib.compress(secret, 9)
+    if len(compressed) >= len(secret):
+        return (secret, 0)
+    return (compressed, FLAG_COMPRESSED)
+
+
+def _decompress(data):
+    decompressor = zlib.decompressobj()
+    data = decompressor.decompress(data, settings.SECRET_MAX_SIZE)
+    if decompressor.unconsumed_tail:
+        raise ValueError("Decompressed secret exceeds the maximum size.")
+    return data
+
+
+def _load_public_key(public_key):
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import serialization
+
     if isinstance(public_key, str):  # pragma: no cover
         public_key = public_key.encode()
+    return serialization.load_pem_public_key(public_key, default_backend())
 
-    if isinstance(secret, str):  # pragma: no cover
-        secret = secret.encode()
 
-    pub_key = serialization.load_pem_public_key(
-        public_key, default_backend()
+def _oaep():
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import padding
+
+    return padding.OAEP(
+        mgf=padding.MGF1(algorithm=hashes.SHA256()),
+        algorithm=hashes.SHA256(),
+        label=None
     )
 
-    return pub_key.encrypt(
-        secret, padding.OAEP(
-            mgf=padding.MGF1(algorithm=hashes.SHA256()),
-            algorithm=hashes.SHA256(),
-            label=None
-        )
+
+def _encrypt_rsa_oaep(pub_key, plaintext, header):
+    return pub_key.encrypt(plaintext, _oaep())
+
+
+def _decrypt_rsa_oaep(priv_key, ciphertext, header):
+    return priv_key.decrypt(ciphertext, _oaep())
+
+
+def _encrypt_rsa_aes_gcm(pub_key, plaintext, header):
+    # A fresh AES key wrapped with RSA-OAEP, so the secret size isn't bound
+    # to the RSA block size. The header is authenticated with the payload.
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+    data_key = AESGCM.generate_key(bit_length=256)
+    nonce = os.urandom(NONCE_SIZE)
+    return pub_key.encrypt(data_key, _oaep()) + nonce +\
+        AESGCM(data_key).encrypt(nonce, plaintext, header)
+
+
+def _decrypt_rsa_aes_gcm(priv_key, ciphertext, header):
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+    key_size = priv_key.key_size // 8
+    data_key = priv_key.decrypt(ciphertext[:key_size], _oaep())
+    nonce = ciphertext[key_size:key_size + NONCE_SIZE]
+    return AESGCM(data_key).decrypt(
+        nonce, ciphertext[key_size + NONCE_SIZE:], header
     )
 
 
-def decrypt(private_key, passphrase, ciphertext):
+# Format version -> (encrypt, decrypt). Only FORMAT_VERSION is written, the
+# others are kept so old ciphertexts can still be read (and upgraded).
+FORMATS = {
+    0: (None, _decrypt_rsa_oaep),
+    1: (_encrypt_rsa_oaep, _decrypt_rsa_oaep),
+    2: (_encrypt_rsa_aes_gcm, _decrypt_rsa_aes_gcm),
+}
+
+
+def _split_header(ciphertext, key_size):
+    if len(ciphertext) == key_size:
+        return (0, 0, b'', ciphertext)
+
+    if ciphertext[:len(HEADER_MAGIC)] != HEADER_MAGIC:
+        raise ValueError("Unknown ciphertext format.")
+
+    version = ciphertext[len(HEADER_MAGIC)]
+    flags = ciphertext[len(HEADER_MAGIC) + 1]
+    if version not in FORMATS:
+        raise ValueError("Unknown ciphertext version: {}".format(version))
+    return (version, flags, ciphertext[:HEADER_SIZE], ciphertext[HEADER_SIZE:])
+
+
+@metrics.timed('crypta_crypt', operation='get_format_version')
+def get_format_version(public_key, ciphertext):
+    pub_key = _load_public_key(public_key)
+    return _split_header(bytes(ciphertext), pub_key.key_size // 8)[0]
+
+
+def needs_upgrade(public_key, ciphertext):
+    return get_format_version(public_key, ciphertext) != FORMAT_VERSION
+
+
+@metrics.timed('crypta_crypt', operation='encrypt')
+def encrypt(public_key, secret):
+    if isinstance(secret, str):  # pragma: no cover
+        secret = secret.encode()
+
+    pub_key = _load_public_key(public_key)
+
+    secret, flags = _compress(secret)
+    header = HEADER_MAGIC + bytes([FORMAT_VERSION, flags])
+    encrypt_func = FORMATS[FORMAT_VERSION][0]
+    return header + encrypt_func(pub_key, secret, header)
+
+
+@metrics.timed('crypta_crypt', operation='unlock_private_key')
+def unlock_private_key(private_key, passphrase):
     if isinstance(private_key, str):  # pragma: no cover
         private_key = private_key.encode()
 
     if isinstance(passphrase, str):  # pragma: no cover
         passphrase = passphrase.encode()
 
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import serialization
+
+    return serialization.load_pem_private_key(
+        private_key, passphrase, default_backend()
+    )
+
+
+@metrics.timed('crypta_crypt', operation='lock_private_key')
+def lock_private_key(priv_key, passphrase):
+    if isinstance(passphrase, str):  # pragma: no cover
+        passphrase = passphrase.encode()
+
+    from cryptography.hazmat.primitives import serialization
+
+    return priv_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.TraditionalOpenSSL,
+        encryption_algorithm=serialization.BestAvailableEncryption(
+            passphrase
+        ),
+    )
+
+
+def dump_private_key(priv_key):
+    ''' Serializes an unlocked key without any passphrase '''
+    from cryptography.hazmat.primitives import serialization
+
+    return priv_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.TraditionalOpenSSL,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+
+
+def load_private_key(private_key):
+    ''' Loads a key serialized by dump_private_key() '''
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import serialization
+
+    return serialization.load_pem_private_key(
+        bytes(private_key), None, default_backend()
+    )
+
+
+@metrics.timed('crypta_crypt', operation='wrap_private_key')
+def wrap_private_key(public_key, priv_key):
+    '''
+    Encrypts an unlocked key to a keyring's public key, so it's opened with
+    an RSA operation instead of a passphrase KDF.
+    '''
+    return encrypt(public_key, dump_private_key(priv_key))
+
+
+@metrics.timed('crypta_crypt', operation='unwrap_private_key')
+def unwrap_private_key(priv_key, wrapped_key):
+    return load_private_key(
+        decrypt_with_key(priv_key, wrapped_key).encode()
+    )
+
+
+def is_wrapped_key(private_key):
+    ''' Wrapped keys are ciphertexts, passphrase locked ones are PEMs '''
+    if private_key is None:
+        return False
+    return bytes(private_key[:len(HEADER_MAGIC)]) == HEADER_MAGIC
+
+
+def open_private_key(private_key, passphrase, keyring_key=None):
+    '''
+    Unlocks a passphrase locked key, or unwraps one wrapped to the keyring
+    whose unlocked key is `keyring_key`.
+    '''
+    if is_wrapped_key(private_key):
+        if keyring_key is None:
+            raise ValueError("This key is wrapped to a keyring.")
+        return unwrap_private_key(keyring_key, private_key)
+    return unlock_private_key(private_key, passphrase)
+
+
+@metrics.timed('crypta_crypt', operation='decrypt')
+def decrypt(private_key, passphrase, ciphertext):
+    return decrypt_with_key(
+        unlock_private_key(private_key, passphrase), ciphertext
+    )
+
+
+@metrics.timed('crypta_crypt', operation='decrypt_with_key')
+def decrypt_with_key(priv_key, ciphertext):
     if isinstance(ciphertext, str):  # pragma: no cover
         ciphertext = ciphertext.encode()
 
-    priv_key = serialization.load_pem_private_key(
-        private_key, passphrase, default_backend()
+    version, flags, header, ciphertext = _split_header(
+        bytes(ciphertext), priv_key.key_size // 8
     )
+    decrypt_func = FORMATS[version][1]
+    plaintext = decrypt_func(priv_key, ciphertext, header)
 
-    return priv_key.decrypt(
-        ciphertext,
-        padding.OAEP(
-            mgf=padding.MGF1(algorithm=hashes.SHA256()),
-            algorithm=hashes.SHA256(),
-            label=None
-        )
-    ).decode()
+    if flags & FLAG_COMPRESSED:
+        plaintext = _decompress(plaintext)
+    return plaintext.decode()
+
+
+@metrics.timed('crypta_crypt', operation='digest')
+def digest(data):
+    if isinstance(data, str):  # pragma: no cover
+        data = data.encode()
+
+    return hashlib.sha256(data).hexdigest()
 
 
+@metrics.timed('crypta_crypt', operation='test_private_key_password')
 def test_private_key_password(private_key, password):
     if isinstance(private_key, str):  # pragma: no cover
         private_key = private_key.encode()
@@ -116,6 +330,9 @@ def test_private_key_password(private_key, password):
     if isinstance(password, str):  # pragma: no cover
         password = password.encode()
 
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import serialization
+
     success = True
     try:
         serialization.load_pem_private_key(
@@ -126,23 +343,48 @@ def test_private_key_password(private_key, password):
     return success
 
 
+@metrics.timed('crypta_crypt', operation='change_password')
 def change_password(private_key, old_password, new_password):
-    if isinstance(private_key, str):  # pragma: no cover
-        private_key = private_key.encode()
+    return lock_private_key(
+        unlock_private_key(private_key, old_password), new_password
+    )
 
-    if isinstance(old_password, str):  # pragma: no cover
-        old_password = old_password.encode()
 
-    if isinstance(new_password, str):  # pragma: no cover
-        new_password = new_password.encode()
+def change_passwords(private_keys, old_password, new_password, workers=None,
+                     skip_invalid=False):
+    '''
+    change_password() over many keys, in parallel. With `skip_invalid`, keys
+    that don't open with `old_password` come back as None instead of
+    raising ValueError.
+    '''
+    def change(private_key):
+        try:
+            return change_password(private_key, old_password, new_password)
+        except ValueError:
+            if not skip_invalid:
+                raise
+            return None
 
-    priv_key = serialization.load_pem_private_key(
-        private_key, old_password, default_backend()
-    )
-    return priv_key.private_bytes(
-        encoding=serialization.Encoding.PEM,
-        format=serialization.PrivateFormat.TraditionalOpenSSL,
-        encryption_algorithm=serialization.BestAvailableEncryption(
-            new_password
+    return _map_in_threads(change, private_keys, workers)
+
+
+def wrap_private_keys(private_keys, passphrase, public_key, workers=None):
+    ''' Unlocks passphrase locked keys and wraps them to `public_key` '''
+    return _map_in_threads(
+        lambda private_key: wrap_private_key(
+            public_key, unlock_private_key(private_key, passphrase)
         ),
+        private_keys, workers,
     )
+
+
+def _map_in_threads(func, items, workers=None):
+    # OpenSSL releases the GIL while it runs, so a pool of threads runs
+    # the KDFs and RSA operations in parallel.
+    items = list(items)
+    if len(items) < 2:
+        return [func(item) for item in items]
+
+    workers = min(workers or os.cpu_count() or 1, len(items))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(func, items))
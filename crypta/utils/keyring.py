@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django-Crypta.
+#
+# Django-Crypta is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Django-Crypta is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
+
+import base64
+import binascii
+import os
+
+from crypta.conf import settings
+from crypta.utils import crypt
+
+SESSION_KEY = '_crypta_keyring'
+NONCE_SIZE = 12
+
+# The unlocked keyring is sealed with a random key: the sealed key is kept
+# in the session and the sealing key in a cookie, so neither the session
+# store nor the browser alone can open it.
+
+
+def remember(request, response, keyring_key):
+    ''' Keeps the unlocked keyring for the rest of the session '''
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+    secret = AESGCM.generate_key(bit_length=256)
+    nonce = os.urandom(NONCE_SIZE)
+    sealed = nonce + AESGCM(secret).encrypt(
+        nonce, crypt.dump_private_key(keyring_key), _get_aad(request)
+    )
+    request.session[SESSION_KEY] = base64.b64encode(sealed).decode()
+    response.set_cookie(
+        settings.KEYRING_COOKIE_NAME,
+        base64.urlsafe_b64encode(secret).decode(),
+        secure=request.is_secure(), httponly=True,
+    )
+
+
+def recall(request):
+    ''' The keyring unlocked earlier in this session, or None '''
+    sealed = request.session.get(SESSION_KEY)
+    secret = request.COOKIES.get(settings.KEYRING_COOKIE_NAME)
+    if not sealed or not secret:
+        return None
+
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+    try:
+        sealed = base64.b64decode(sealed)
+        keyring_key = AESGCM(base64.urlsafe_b64decode(secret)).decrypt(
+            sealed[:NONCE_SIZE], sealed[NONCE_SIZE:], _get_aad(request)
+        )
+    except (InvalidTag, ValueError, binascii.Error):
+        return None
+    return crypt.load_private_key(keyring_key)
+
+
+def _get_aad(request):
+    # Binds the sealed keyring to its user
+    return str(request.user.pk).encode()
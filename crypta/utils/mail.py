@@ -16,41 +16,100 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
 
-from django.contrib.sites.models import Site
-from django.core.mail import EmailMultiAlternatives
-from django.template import TemplateDoesNotExist
-from django.template.loader import render_to_string
+import itertools
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.template import TemplateDoesNotExist, loader
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from crypta.conf import settings
+from crypta.utils import metrics
+
+
+_templates = {}
+
+
+def get_template(template_name):
+    '''
+    The compiled `template_name`, or None when it doesn't exist. Both are
+    remembered for the life of the process, unless DEBUG is on so template
+    edits show up right away.
+    '''
+    try:
+        return _templates[template_name]
+    except KeyError:
+        pass
+
+    try:
+        template = loader.get_template(template_name)
+    except TemplateDoesNotExist:
+        template = None
+
+    if not settings.DEBUG:
+        _templates[template_name] = template
+    return template
 
 
 class BaseEmail:
     subject = None
     txt_template = None
     html_template = None
+    # Emails carrying secrets (e.g. invite codes) must not sit in the outbox
+    coalesce = True
 
     def __init__(self, to, context, *args, **kwargs):
         self.to = to
         self.context = context
-        context['site'] = Site.objects.get_current()
 
         self._html = None
         self._text = None
         self._args = args
         self._kwargs = kwargs
 
+    @classmethod
+    def send_many(cls, recipients, from_addr=None, fail_silently=False):
+        '''
+        Sends this email to each (to, context) of `recipients`, rendered
+        against the same compiled templates and over a single connection.
+        '''
+        from django.contrib.sites.models import Site
+
+        site = Site.objects.get_current()
+        emails = [
+            cls(to, dict(context, site=site)) for to, context in recipients
+        ]
+        connection = get_connection(fail_silently=fail_silently)
+        messages = []
+        with metrics.timer('crypta_mail_send', email=cls.__name__):
+            for email in emails:
+                if email.coalesce and settings.NOTIFICATION_WINDOW:
+                    email.queue(from_addr)
+                else:
+                    messages.append(
+                        email.get_message(from_addr, connection=connection)
+                    )
+            if messages:
+                connection.send_messages(messages)
+        return emails
+
     def get_subject(self):
         return self.subject
 
-    def _render(self, template, context):
-        try:
-            rendered_template = render_to_string(template, self.context)
-        except TemplateDoesNotExist:
-            rendered_template = None
-        return rendered_template
+    def _render(self, template_name, context):
+        template = get_template(template_name)
+        if template is None:  # pragma: no coverage
+            return None
+        return template.render(context)
+
+    def render(self):
+        if 'site' not in self.context:
+            from django.contrib.sites.models import Site
+            self.context['site'] = Site.objects.get_current()
 
-    def send(self, from_addr=None, fail_silently=False):
         if self.html_template:  # pragma: no coverage
             self._html = self._render(self.html_template, self.context)
 
@@ -65,21 +124,48 @@ class BaseEmail:
         if isinstance(self.to, str):
             self.to = [self.to]
 
+    def get_message(self, from_addr=None, connection=None):
+        self.render()
         if not from_addr:  # pragma: no coverage
             from_addr = getattr(settings, 'CRYPTA_EMAIL_FROM_ADDR')
 
         msg = EmailMultiAlternatives(
-            self.get_subject(), self._text, from_addr, self.to
+            self.get_subject(), self._text, from_addr, self.to,
+            connection=connection,
         )
         if self._html:  # pragma: no coverage
             msg.attach_alternative(self._html, 'text/html')
-        msg.send(fail_silently)
+        return msg
+
+    def send(self, from_addr=None, fail_silently=False):
+        with metrics.timer('crypta_mail_send', email=type(self).__name__):
+            if self.coalesce and settings.NOTIFICATION_WINDOW:
+                self.queue(from_addr)
+            else:
+                self.get_message(from_addr).send(fail_silently)
+
+    def queue(self, from_addr=None):
+        '''
+        Renders the email into the outbox, where it waits for the other
+        notifications of its recipients (see flush_notifications).
+        '''
+        self.render()
+        Notification = apps.get_model('crypta', 'Notification')
+        Notification.objects.bulk_create([
+            Notification(
+                recipient=recipient, from_addr=from_addr or '',
+                subject=str(self.get_subject()), text=self._text or '',
+                html=self._html or '',
+            )
+            for recipient in self.to
+        ])
 
 
 class VaultInviteEmail(BaseEmail):
     subject = _("You've received a invite to join a Vault!")
     txt_template = 'crypta/mail/invite.txt'
     html_template = 'crypta/mail/invite.' + settings.TEMPLATE_EXTENSION
+    coalesce = False
 
 
 class VaultInviteAcceptedEmail(BaseEmail):
@@ -105,3 +191,74 @@ class MembershipDemotionEmail(MembershipPromotionEmail):
     txt_template = 'crypta/mail/membership_demotion.txt'
     html_template = 'crypta/mail/membership_demotion.' +\
         settings.TEMPLATE_EXTENSION
+
+
+class MembershipChangesEmail(BaseEmail):
+    subject = _("Your memberships have changed!")
+    txt_template = 'crypta/mail/membership_changes.txt'
+    html_template = 'crypta/mail/membership_changes.' +\
+        settings.TEMPLATE_EXTENSION
+
+
+class NotificationsEmail(BaseEmail):
+    subject = _("You have {0} new notifications")
+    txt_template = 'crypta/mail/notifications.txt'
+    html_template = 'crypta/mail/notifications.' + settings.TEMPLATE_EXTENSION
+
+    def get_subject(self):
+        return self.subject.format(len(self.context['notifications']))
+
+
+def get_notification_message(recipient, notifications, connection=None):
+    ''' A single message out of the outbox `notifications` of `recipient` '''
+    from_addr = next((n.from_addr for n in notifications if n.from_addr), None)
+    if len(notifications) == 1:
+        notification = notifications[0]
+        msg = EmailMultiAlternatives(
+            notification.subject, notification.text,
+            from_addr or getattr(settings, 'CRYPTA_EMAIL_FROM_ADDR'),
+            [recipient], connection=connection,
+        )
+        if notification.html:  # pragma: no coverage
+            msg.attach_alternative(notification.html, 'text/html')
+        return msg
+
+    email = NotificationsEmail(
+        to=recipient, context={'notifications': notifications}
+    )
+    return email.get_message(from_addr, connection=connection)
+
+
+def flush_notifications(force=False):
+    '''
+    Sends, over a single connection, one message to every recipient whose
+    oldest notification waited for NOTIFICATION_WINDOW seconds (or to all
+    of them, with `force`). Returns the number of messages sent.
+    '''
+    Notification = apps.get_model('crypta', 'Notification')
+    with metrics.timer('crypta_mail_flush'), transaction.atomic():
+        pending = Notification.objects.select_for_update()
+        if not force:
+            due_on = timezone.now() - timedelta(
+                seconds=settings.NOTIFICATION_WINDOW
+            )
+            pending = pending.filter(recipient__in=Notification.objects.filter(
+                created_on__lte=due_on
+            ).values('recipient'))
+        pending = list(pending.order_by('recipient', 'created_on'))
+        if not pending:
+            return 0
+
+        connection = get_connection()
+        messages = [
+            get_notification_message(recipient, list(notifications),
+                                     connection=connection)
+            for recipient, notifications in itertools.groupby(
+                pending, key=lambda notification: notification.recipient
+            )
+        ]
+        connection.send_messages(messages)
+        Notification.objects.filter(
+            pk__in=[notification.pk for notification in pending]
+        ).delete()
+    return len(messages)
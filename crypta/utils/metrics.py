@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django-Crypta.
+#
+# Django-Crypta is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Django-Crypta is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
+
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.db import connections
+from django.utils.module_loading import import_string
+
+from crypta.conf import settings
+
+TIME_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Registry:
+    '''
+    In-process store of counters and histograms. Every value recorded is
+    also forwarded to the sinks listed on CRYPTA_METRICS_SINKS.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._sinks = None
+
+    def get_sinks(self):
+        if self._sinks is None:
+            self._sinks = [import_string(s) for s in settings.METRICS_SINKS]
+        return self._sinks
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+        for sink in self.get_sinks():
+            sink('counter', name, labels, value)
+
+    def observe(self, name, value, buckets=TIME_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = {
+                    'buckets': buckets,
+                    'counts': [0] * len(buckets),
+                    'sum': 0,
+                    'count': 0,
+                }
+            histogram = self._histograms[key]
+            for (i, bound) in enumerate(histogram['buckets']):
+                if value <= bound:
+                    histogram['counts'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+        for sink in self.get_sinks():
+            sink('histogram', name, labels, value)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._sinks = None
+
+    def export_text(self):
+        ''' Renders all metrics in the Prometheus text exposition format '''
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, dict(value, counts=list(value['counts'])))
+                for (key, value) in self._histograms.items()
+            )
+
+        lines = []
+        last_name = None
+        for ((name, labels), value) in counters:
+            if name != last_name:
+                lines.append('# TYPE {} counter'.format(name))
+                last_name = name
+            lines.append('{}{} {}'.format(name, _format_labels(labels), value))
+
+        for ((name, labels), histogram) in histograms:
+            if name != last_name:
+                lines.append('# TYPE {} histogram'.format(name))
+                last_name = name
+            for (bound, count) in zip(histogram['buckets'],
+                                      histogram['counts']):
+                lines.append('{}_bucket{} {}'.format(
+                    name, _format_labels(labels + (('le', bound),)), count
+                ))
+            lines.append('{}_bucket{} {}'.format(
+                name, _format_labels(labels + (('le', '+Inf'),)),
+                histogram['count']
+            ))
+            lines.append('{}_sum{} {}'.format(
+                name, _format_labels(labels), histogram['sum']
+            ))
+            lines.append('{}_count{} {}'.format(
+                name, _format_labels(labels), histogram['count']
+            ))
+
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(key, str(value).replace('"', '\\"'))
+        for (key, value) in labels
+    ) + '}'
+
+
+registry = Registry()
+
+
+def is_enabled():
+    # Read through the Django settings so it can be toggled at runtime
+    return settings.CRYPTA_METRICS_ENABLED
+
+
+class QueryCounter:
+    '''
+    Counts the queries ran while active, on `using` or else on every
+    configured database (e.g. the replica crypta.routers reads from).
+    '''
+    def __init__(self, using=None):
+        aliases = [using] if using is not None else list(connections)
+        self.connections = [connections[alias] for alias in aliases]
+        self._count = 0
+        self._contexts = []
+
+    def _execute(self, execute, sql, params, many, context):
+        self._count += 1
+        return execute(sql, params, many, context)
+
+    def _get_context(self, connection):
+        # Django < 2.0 has no execute_wrapper, fall back to the debug cursor
+        if hasattr(connection, 'execute_wrapper'):  # pragma: no cover
+            return connection.execute_wrapper(self._execute)
+        # django.test is only loaded when actually needed
+        from django.test.utils import CaptureQueriesContext
+        return CaptureQueriesContext(connection)
+
+    def __enter__(self):
+        self._contexts = []
+        for connection in self.connections:
+            context = self._get_context(connection)
+            context.__enter__()
+            self._contexts.append(context)
+        return self
+
+    def __exit__(self, *exc_info):
+        for context in reversed(self._contexts):
+            context.__exit__(*exc_info)
+
+    @property
+    def count(self):
+        return self._count + sum(
+            len(context) for context in self._contexts
+            if hasattr(context, 'captured_queries')
+        )
+
+
+@contextmanager
+def timer(name, **labels):
+    if not is_enabled():
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        registry.inc(name + '_errors_total', **labels)
+        raise
+    finally:
+        registry.observe(name + '_seconds', time.perf_counter() - start,
+                         **labels)
+
+
+def timed(name, **labels):
+    def decorator(func):
+        @wraps(func)
+        def inner(*args, **kwargs):
+            if not is_enabled():
+                return func(*args, **kwargs)
+            with timer(name, **labels):
+                return func(*args, **kwargs)
+        return inner
+    return decorator
+
+
+@contextmanager
+def count_view_queries(view_name):
+    ''' Observes the queries ran on this thread as crypta_view_queries '''
+    if not is_enabled():
+        yield
+        return
+
+    with QueryCounter() as queries:
+        yield
+    registry.observe('crypta_view_queries', queries.count,
+                     buckets=QUERY_BUCKETS, view=view_name)
+
+
+def instrument_view(view, view_name):
+    if inspect.iscoroutinefunction(view):
+        # Async views run their queries on worker threads, where they are
+        # counted by crypta.views.asynchronous.AsyncViewMixin.
+        @wraps(view)
+        async def async_inner(request, *args, **kwargs):
+            with timer('crypta_view', view=view_name):
+                return await view(request, *args, **kwargs)
+        return async_inner
+
+    @wraps(view)
+    def inner(request, *args, **kwargs):
+        with count_view_queries(view_name):
+            with timer('crypta_view', view=view_name):
+                return view(request, *args, **kwargs)
+    return inner
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django-Crypta.
+#
+# Django-Crypta is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Django-Crypta is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
+
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+def encode_cursor(values):
+    ''' Turns the ordering values of a row into an opaque url-safe cursor '''
+    data = json.dumps([str(value) for value in values]).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    ''' Inverse of encode_cursor(), raising ValueError on bad input '''
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(data.decode())
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError("Invalid cursor: {!r}".format(cursor))
+
+    if not isinstance(values, list) or len(values) != size or \
+            not all(isinstance(value, str) for value in values):
+        raise ValueError("Invalid cursor: {!r}".format(cursor))
+    return values
+
+
+class KeysetPage:
+    def __init__(self, object_list, has_previous, has_next, fields):
+        self.object_list = object_list
+        self.has_previous = has_previous
+        self.has_next = has_next
+        self.fields = fields
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def _cursor(self, obj):
+        return encode_cursor(getattr(obj, field) for field in self.fields)
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous:
+            return self._cursor(self.object_list[0])
+
+    @property
+    def next_cursor(self):
+        if self.has_next:
+            return self._cursor(self.object_list[-1])
+
+
+class KeysetPaginator:
+    '''
+    Paginates `queryset` by seeking past the last row shown instead of using
+    OFFSET, so every page costs the same single indexed query. The `fields`
+    must uniquely order the rows, hence the primary key as the last one.
+    '''
+    def __init__(self, queryset, per_page, fields=('name', 'pk'),
+                 descending=False):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.fields = fields
+        self.descending = descending
+
+    def _seek(self, values, forward):
+        lookup = 'gt' if forward != self.descending else 'lt'
+        condition = Q()
+        for index, field in enumerate(self.fields):
+            clause = Q(**dict(zip(self.fields[:index], values[:index])))
+            clause &= Q(**{'{}__{}'.format(field, lookup): values[index]})
+            condition |= clause
+        return condition
+
+    def _to_python(self, values):
+        # Cursors come from the url, so their values must be valid for the
+        # ordering fields before they reach a lookup.
+        opts = self.queryset.model._meta
+        try:
+            return [
+                (opts.pk if field == 'pk' else opts.get_field(field))
+                .to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except ValidationError:
+            raise ValueError("Invalid cursor values: {!r}".format(values))
+
+    def _order_by(self, forward):
+        prefix = '-' if forward == self.descending else ''
+        return [prefix + field for field in self.fields]
+
+    def page(self, after=None, before=None):
+        ''' Rows following the `after` cursor or preceding `before` one '''
+        forward = before is None
+        cursor = after if forward else before
+
+        queryset = self.queryset.order_by(*self._order_by(forward))
+        if cursor:
+            values = self._to_python(
+                decode_cursor(cursor, len(self.fields))
+            )
+            queryset = queryset.filter(self._seek(values, forward))
+
+        object_list = list(queryset[:self.per_page + 1])
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+
+        if forward:
+            return KeysetPage(object_list, bool(cursor), has_more,
+                              self.fields)
+
+        object_list.reverse()
+        return KeysetPage(object_list, has_more, True, self.fields)
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django-Crypta.
+#
+# Django-Crypta is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Django-Crypta is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+import unicodedata
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+MAX_TOKEN_LENGTH = 100
+
+
+def normalize(text):
+    ''' Lowercases `text` and strips its accents '''
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    ''' Splits `text` into its unique normalized words, in order '''
+    tokens = []
+    for word in WORD_RE.findall(normalize(text)):
+        word = word[:MAX_TOKEN_LENGTH]
+        if word not in tokens:
+            tokens.append(word)
+    return tokens
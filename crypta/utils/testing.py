@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django-Crypta.
+#
+# Django-Crypta is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Django-Crypta is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import subprocess
+import sys
+
+from django.utils.module_loading import import_module
+
+from crypta.conf import settings
+from crypta.middleware import get_query_budget
+from crypta.utils.metrics import QueryCounter
+
+try:  # pragma: no cover
+    from django.urls import RegexURLResolver
+except ImportError:  # pragma: no cover
+    try:
+        from django.core.urlresolvers import RegexURLResolver
+    except ImportError:
+        from django.urls import URLResolver as RegexURLResolver
+
+
+def get_url_names(urlconf='crypta.urls'):
+    ''' Lists the namespaced names of every URL declared on `urlconf` '''
+    names = []
+    patterns = import_module(urlconf).urlpatterns
+    stack = [(pattern, '') for pattern in patterns]
+    while stack:
+        pattern, namespace = stack.pop(0)
+        if isinstance(pattern, RegexURLResolver):
+            prefix = namespace
+            if pattern.namespace:
+                prefix += pattern.namespace + ':'
+            stack.extend((p, prefix) for p in pattern.url_patterns)
+        elif pattern.name:
+            names.append(namespace + pattern.name)
+    return names
+
+
+IMPORT_SCRIPT = '''
+import importlib, json, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+importlib.import_module({module!r})
+print(json.dumps({{
+    'seconds': time.perf_counter() - start, 'modules': sorted(sys.modules),
+}}))
+'''
+
+
+def measure_import(module):
+    '''
+    Imports `module` right after django.setup() in a fresh interpreter, using
+    the current settings, and returns the seconds it took along with the
+    names of all modules loaded by then.
+    '''
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    env.setdefault('DJANGO_SETTINGS_MODULE', settings.SETTINGS_MODULE)
+    output = subprocess.check_output(
+        [sys.executable, '-c', IMPORT_SCRIPT.format(module=module)], env=env
+    )
+    result = json.loads(output.decode().splitlines()[-1])
+    return (result['seconds'], result['modules'])
+
+
+class QueryBudgetTestMixin:
+    '''
+    TestCase mixin asserting the number of queries ran by crypta views.
+    Budgets default to CRYPTA_QUERY_BUDGET(S), the same ones used by
+    crypta.middleware.QueryBudgetMiddleware.
+    '''
+    query_budget_scales = (1, 5, 25)
+
+    def count_queries(self, url, method='get', data=None, **extra):
+        with QueryCounter() as queries:
+            response = getattr(self.client, method)(url, data or {}, **extra)
+        return (queries.count, response)
+
+    def assertQueryBudget(self, url, budget=None, method='get', data=None,
+                          **extra):
+        count, response = self.count_queries(url, method, data, **extra)
+        if budget is None:
+            budget = get_query_budget(response.resolver_match.view_name)
+
+        self.assertLessEqual(count, budget, "{} {} ran {} queries, over the "
+                             "budget of {}".format(method.upper(), url, count,
+                                                   budget))
+        return response
+
+    def assertQueriesDontScale(self, url, populate, scales=None,
+                               method='get', data=None, **extra):
+        '''
+        Calls `populate(scale)` to grow the data behind `url` to each scale
+        and asserts the query count stays the same (no N+1).
+        '''
+        counts = []
+        for scale in scales or self.query_budget_scales:
+            populate(scale)
+            counts.append(self.count_queries(url, method, data, **extra)[0])
+
+        self.assertEqual(len(set(counts)), 1, "{} {} queries grow with the "
+                         "data: {}".format(method.upper(), url, counts))
+
+    def assertBudgetsCoverUrls(self, tested, urlconf='crypta.urls'):
+        ''' Fails if any URL of `urlconf` is missing from `tested` '''
+        missing = sorted(set(get_url_names(urlconf)) - set(tested))
+        self.assertEqual(missing, [], "URLs without query budget tests: "
+                         "{}".format(', '.join(missing)))
+
+
+class ImportBudgetTestMixin:
+    '''
+    TestCase mixin asserting the cold start cost of crypta: the time to
+    set Django up and import a module, and that heavy dependencies are
+    only loaded on first use.
+    '''
+    import_budget_lazy_modules = (
+        'cryptography.hazmat.primitives.asymmetric',
+        'cryptography.hazmat.primitives.ciphers',
+        'django.test',
+        'jsonschema',
+        'orjson',
+    )
+
+    def assertImportBudget(self, module='crypta.urls', budget=None,
+                           lazy_modules=None):
+        if budget is None:
+            budget = settings.IMPORT_BUDGET
+
+        seconds, modules = measure_import(module)
+        self.assertLessEqual(seconds, budget, "Importing {} took {:.3f}s, "
+                             "over the budget of {}s".format(module, seconds,
+                                                             budget))
+
+        if lazy_modules is None:
+            lazy_modules = self.import_budget_lazy_modules
+        loaded = [
+            name for name in modules
+            if any(name == lazy or name.startswith(lazy + '.')
+                   for lazy in lazy_modules)
+        ]
+        self.assertEqual(loaded, [], "Importing {} eagerly loaded: "
+                         "{}".format(module, ', '.join(loaded)))
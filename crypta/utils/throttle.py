@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django-Crypta.
+#
+# Django-Crypta is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Django-Crypta is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from crypta.conf import settings
+
+
+def get_cache():
+    return caches[settings.THROTTLE_CACHE]
+
+
+def get_remote_addr(request):
+    return request.META.get('REMOTE_ADDR')
+
+
+def get_forwarded_for(request):
+    '''
+    The address the (single, trusted) reverse proxy in front of the site
+    appended to X-Forwarded-For; use it as THROTTLE_CLIENT_IP when
+    REMOTE_ADDR is always the proxy's own address.
+    '''
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+    addresses = [a.strip() for a in forwarded.split(',') if a.strip()]
+    return addresses[-1] if addresses else get_remote_addr(request)
+
+
+def get_client_ip(request):
+    resolver = import_string(settings.THROTTLE_CLIENT_IP)
+    return resolver(request) or 'unknown'
+
+
+def get_buckets(request):
+    '''
+    The IP address and the user behind `request`, each with its budget. An
+    address is shared by everyone behind the same NAT or proxy, so it gets
+    the larger THROTTLE_IP_BUDGET.
+    '''
+    buckets = []
+    if settings.THROTTLE_IP_BUDGET:
+        buckets.append(('ip:{}'.format(get_client_ip(request)),
+                        settings.THROTTLE_IP_BUDGET))
+    if request.user.is_authenticated:
+        buckets.append(('user:{}'.format(request.user.pk),
+                        settings.THROTTLE_BUDGET))
+    return buckets
+
+
+def consume(request, cost, now=None):
+    '''
+    Charges `cost` crypto operations to the user and the IP address of
+    `request` in the current THROTTLE_WINDOW. Returns 0 when both stay
+    within their budgets or else the seconds until the window ends.
+    '''
+    if not settings.THROTTLE_BUDGET:
+        return 0
+
+    now = now or time.time()
+    window = int(now // settings.THROTTLE_WINDOW)
+    retry_after = (window + 1) * settings.THROTTLE_WINDOW - now
+
+    cache = get_cache()
+    over_budget = False
+    for bucket, budget in get_buckets(request):
+        key = 'crypta:throttle:{}:{}'.format(bucket, window)
+        # add() then incr() so concurrent requests never lose a charge
+        cache.add(key, 0, settings.THROTTLE_WINDOW + 1)
+        try:
+            spent = cache.incr(key, cost)
+        except ValueError:  # pragma: no cover (evicted meanwhile)
+            cache.set(key, cost, settings.THROTTLE_WINDOW + 1)
+            spent = cost
+        if spent > budget:
+            over_budget = True
+
+    return int(retry_after) + 1 if over_budget else 0
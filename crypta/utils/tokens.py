@@ -85,7 +85,7 @@ class SecretUpdateTokenGenerator():
                 microsecond=0, tzinfo=None
             )
 
-        return str(user.pk) + secret_obj.hex_data.decode() +\
+        return str(user.pk) + secret_obj.get_data_digest() +\
             str(update_timestamp) + str(timestamp)
 
     def _now(self):
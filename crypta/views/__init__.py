@@ -20,5 +20,16 @@ from .invite import *
 from .membership import *
 from .vault import *
 from .secret import *
+from .metrics import *
 
-__all__ = ['vault', 'invite', 'membership', 'secret']
+from crypta.conf import settings
+
+if settings.ASYNC_VIEWS:  # pragma: no cover
+    from .asynchronous import (
+        AsyncInviteAcceptView as InviteAcceptView,
+        AsyncInviteCreateView as InviteCreateView,
+        AsyncSecretDetailView as SecretDetailView,
+        AsyncVaultDetailView as VaultDetailView,
+    )
+
+__all__ = ['vault', 'invite', 'membership', 'secret', 'metrics']
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django-Crypta.
+#
+# Django-Crypta is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Django-Crypta is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.db import close_old_connections
+from django.views.generic import View
+
+from crypta.conf import settings
+from crypta.utils import metrics
+from crypta.views import invite, secret, vault
+
+_executor = None
+
+
+def get_executor():
+    ''' Bounded pool where the KDF, RSA and SMTP heavy work is ran '''
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.ASYNC_WORKERS or os.cpu_count() or 1,
+            thread_name_prefix='crypta',
+        )
+    return _executor
+
+
+def _run_in_worker(func, *args, **kwargs):
+    # Workers are long lived threads, so their connections must follow the
+    # same lifecycle (CONN_MAX_AGE) a request thread would.
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_in_executor(func, *args, **kwargs):
+    # Request scoped state (e.g. crypta.routers) follows the work into the
+    # worker through a copy of the current context.
+    loop = asyncio.get_event_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        get_executor(),
+        partial(context.run, _run_in_worker, func, *args, **kwargs),
+    )
+
+
+class AsyncViewMixin:
+    '''
+    Turns a crypta view into an async one. Cheap GETs (ORM and templates)
+    run through sync_to_async, while POSTs, which unlock keys, decrypt and
+    send mails, run on the bounded crypta executor so the event loop keeps
+    serving other requests.
+    '''
+    http_method_names = ['get', 'post', 'head', 'options']
+
+    @classmethod
+    def as_view(cls, **kwargs):
+        # Bypasses LoginRequiredMixin.as_view, login_required only wraps
+        # sync views on most Django versions.
+        view = View.as_view.__func__(cls, **kwargs)
+
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            is_authenticated = await sync_to_async(
+                lambda: request.user.is_authenticated
+            )()
+            if not is_authenticated:
+                return redirect_to_login(request.get_full_path())
+
+            response = view(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+            return response
+        return metrics.instrument_view(inner, cls.__name__)
+
+    def _render(self, handler, request, *args, **kwargs):
+        with metrics.count_view_queries(type(self).__name__):
+            response = handler(request, *args, **kwargs)
+            if hasattr(response, 'render') and callable(response.render):
+                response = response.render()
+        return response
+
+    async def get(self, request, *args, **kwargs):
+        return await sync_to_async(self._render)(
+            super().get, request, *args, **kwargs
+        )
+
+    async def post(self, request, *args, **kwargs):
+        return await run_in_executor(
+            self._render, super().post, request, *args, **kwargs
+        )
+
+
+class AsyncSecretDetailView(AsyncViewMixin, secret.SecretDetailView):
+    pass
+
+
+class AsyncVaultDetailView(AsyncViewMixin, vault.VaultDetailView):
+    pass
+
+
+class AsyncInviteCreateView(AsyncViewMixin, invite.InviteCreateView):
+    pass
+
+
+class AsyncInviteAcceptView(AsyncViewMixin, invite.InviteAcceptView):
+    pass
@@ -18,6 +18,7 @@
 
 from django.http import Http404, HttpResponseRedirect
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from django.views.generic import (CreateView, DeleteView, FormView, ListView,
                                   View)
 
@@ -32,14 +33,44 @@ except ImportError:  # pragma: no cover
     from django.urls import reverse_lazy
 
 
-class VaultInviteListView(mixins.LoginRequiredMixin, ListView):
+class VaultInviteListView(mixins.LoginRequiredMixin, mixins.VaultETagMixin,
+                          ListView):
     ''' List all invites for a specific vault '''
     model = models.Invite
     template_name = 'crypta/invite/by_vault.' + settings.TEMPLATE_EXTENSION
+    paginate_by = settings.INVITE_PAGE_SIZE
+    orderings = {
+        'invited_on': ('-invited_on', 'pk'),
+        'expires': ('days_left', 'expires_on', 'pk'),
+        'status': ('status_code', '-invited_on', 'pk'),
+        'invitee': ('invitee__first_name', 'pk'),
+    }
+
+    def get_etag_queryset(self):
+        return models.Vault.objects.owned_by(self.request.user).filter(
+            slug=self.kwargs.get('slug', None)
+        )
+
+    def get_etag_data(self):
+        # Invite status and days to expire change with time alone, so they
+        # are part of the validator along with the vault version.
+        now = timezone.now()
+        rows = self.get_etag_queryset().order_by(
+            'pk', 'invite__expires_on'
+        ).values_list(
+            'pk', 'version', 'invite__expires_on'
+        )
+        return [
+            (pk, version, (expires_on - now).days if expires_on else None)
+            for (pk, version, expires_on) in rows
+        ]
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['vault'] = self.vault
+        context['status'] = self.status
+        context['statuses'] = models.INVITE_STATUSES
+        context['order'] = self.order
         return context
 
     def get_queryset(self):
@@ -51,12 +82,23 @@ class VaultInviteListView(mixins.LoginRequiredMixin, ListView):
             vault=self.vault,
             vault__membership__member=self.request.user,
             vault__membership__role__in=['owner', 'admin'],
-        )
+        ).select_related('inviter', 'invitee').with_status()
+
+        self.status = self.request.GET.get('status', '')
+        if self.status in models.INVITE_STATUSES_MAP:
+            self.queryset = self.queryset.filter(status_code=self.status)
+
+        self.order = self.request.GET.get('order', 'invited_on')
+        if self.order not in self.orderings:
+            self.order = 'invited_on'
+        self.queryset = self.queryset.order_by(*self.orderings[self.order])
         return super().get_queryset()
 
 
-class InviteCreateView(mixins.LoginRequiredMixin, CreateView):
+class InviteCreateView(mixins.LoginRequiredMixin, mixins.CryptoThrottleMixin,
+                       mixins.KeyringMixin, CreateView):
     ''' Creates a new Invite '''
+    throttle_cost = 2  # Unlocks the inviter key, locks it with the token
     model = models.Invite
     form_class = forms.CreateInviteForm
     template_name = 'crypta/invite/create.' + settings.TEMPLATE_EXTENSION
@@ -81,6 +123,11 @@ class InviteCreateView(mixins.LoginRequiredMixin, CreateView):
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
         kwargs['user'] = self.request.user
+        if self.request.method == 'POST':
+            membership = models.Membership.objects.with_keys().get(
+                vault=self.vault, member=self.request.user, excluded=False
+            )
+            kwargs['private_key'] = membership.priv_key
         return kwargs
 
     def form_valid(self, form):
@@ -89,16 +136,39 @@ class InviteCreateView(mixins.LoginRequiredMixin, CreateView):
             inviter_pass=form.cleaned_data['password'],
             invitee=form.cleaned_data['invitee'],
             role=form.cleaned_data['role'],
-            vault=self.vault
+            vault=self.vault,
+            inviter_key=form.unlocked_key,
         )
         return HttpResponseRedirect(self.get_success_url())
 
 
-class InviteAcceptView(mixins.LoginRequiredMixin, FormView):
+class InviteAcceptView(mixins.LoginRequiredMixin, mixins.CryptoThrottleMixin,
+                       mixins.KeyringMixin, FormView):
     ''' View used by the invitee to accept the invite '''
+    throttle_cost = 3  # Checks the token, then unlocks and locks the key
     form_class = forms.AcceptInviteForm
     template_name = 'crypta/invite/accept.' + settings.TEMPLATE_EXTENSION
 
+    def get(self, request, *args, **kwargs):
+        response = self.get_closed_invite_response()
+        return response or super().get(request, *args, **kwargs)
+
+    def post(self, request, *args, **kwargs):
+        response = self.get_closed_invite_response()
+        return response or super().post(request, *args, **kwargs)
+
+    def get_closed_invite_response(self):
+        self.invite = get_object_or_404(
+            models.Invite.objects.with_keys(),
+            pk=self.kwargs.get('pk', None),
+            invitee=self.request.user,
+        )
+        # Accepted and expired invites have no key left to accept, so the
+        # template only explains why, without any form.
+        if self.invite.accepted or self.invite.is_expired:
+            return self.render_to_response({'invite': self.invite})
+        return None
+
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
         context['invite'] = self.invite
@@ -107,11 +177,6 @@ class InviteAcceptView(mixins.LoginRequiredMixin, FormView):
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
         kwargs['user'] = self.request.user
-        self.invite = get_object_or_404(
-            models.Invite,
-            pk=self.kwargs.get('pk', kwargs),
-            invitee=self.request.user,
-        )
         kwargs['invite'] = self.invite
         return kwargs
 
@@ -165,8 +230,10 @@ class InviteRenewView(mixins.LoginRequiredMixin, View):
         return HttpResponseRedirect(self.get_success_url())
 
 
-class InviteResendView(mixins.LoginRequiredMixin, FormView):
+class InviteResendView(mixins.LoginRequiredMixin, mixins.CryptoThrottleMixin,
+                       mixins.KeyringMixin, FormView):
     ''' Where the admins and owners can resend invites '''
+    throttle_cost = 2  # Unlocks the inviter key, locks it with the token
     model = models.Invite
     form_class = PasswordConfirmFormMixin
     template_name = 'crypta/invite/resend.' + settings.TEMPLATE_EXTENSION
@@ -183,7 +250,7 @@ class InviteResendView(mixins.LoginRequiredMixin, FormView):
             pk=self.kwargs['pk'],
         )
 
-        user_membership = models.Membership.objects.get(
+        user_membership = models.Membership.objects.with_keys().get(
             vault=self.object.vault, member=self.request.user
         )
         if self.object.role == 'owner' and user_membership.role != 'owner':
@@ -191,10 +258,12 @@ class InviteResendView(mixins.LoginRequiredMixin, FormView):
 
         self.vault = self.object.vault
         kwargs['user'] = self.request.user
+        kwargs['private_key'] = user_membership.priv_key
         return kwargs
 
     def form_valid(self, form):
         self.object.resend(
-            self.request.user, form.cleaned_data['password']
+            self.request.user, form.cleaned_data['password'],
+            inviter_key=form.unlocked_key,
         )
         return HttpResponseRedirect(self.get_success_url())
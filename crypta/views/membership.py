@@ -16,25 +16,39 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
 
-from django.http import Http404
+from django.http import Http404, HttpResponse, HttpResponseRedirect
 from django.shortcuts import get_object_or_404
-from django.views.generic import DeleteView, ListView, UpdateView
+from django.utils.translation import gettext_lazy as _
+from django.views.generic import DeleteView, FormView, ListView, UpdateView
 
 from crypta import forms, models
 from crypta.mixins import views as mixins
+from crypta.mixins.models import ConcurrentUpdateError
 from crypta.conf import settings
+from crypta.utils import access
 
 try:  # pragma: no cover
     from django.core.urlresolvers import reverse_lazy
 except ImportError:  # pragma: no cover
     from django.urls import reverse_lazy
 
+CONFLICT_MESSAGE = _(
+    "Sorry, but this membership was changed by someone else meanwhile. "
+    "Please, review it and try again."
+)
 
-class VaultMembershipListView(mixins.LoginRequiredMixin, ListView):
+
+class VaultMembershipListView(mixins.LoginRequiredMixin,
+                              mixins.VaultETagMixin, ListView):
     ''' List vault's membership '''
     model = models.Membership
     template_name = 'crypta/membership/by_vault.' + settings.TEMPLATE_EXTENSION
 
+    def get_etag_queryset(self):
+        return models.Vault.objects.managed_by(self.request.user).filter(
+            slug=self.kwargs.get('slug', None)
+        )
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['vault'] = self.vault
@@ -52,7 +66,7 @@ class VaultMembershipListView(mixins.LoginRequiredMixin, ListView):
 
         self.queryset = self.queryset.filter(vault=self.vault).exclude(
             member=self.request.user
-        )
+        ).select_related('member')
         return super().get_queryset()
 
 
@@ -66,25 +80,29 @@ class MembershipDeleteView(mixins.LoginRequiredMixin, DeleteView):
 
     def get_object(self, queryset=None):
         obj = get_object_or_404(
-            self.model.objects,
+            self.model.objects.from_vault_managed_by(self.request.user),
             pk=self.request.POST['pk'],
-            vault__membership__member=self.request.user,
-            vault__membership__role__in=('owner', 'admin'),
             vault__excluded=False,
         )
-        current_user_membership = self.model.objects.get(
-            vault=obj.vault, member=self.request.user
-        )
+        current_user_role = access.get_role(self.request.user, obj.vault_id)
 
-        if obj.member == self.request.user:
+        if obj.member_id == self.request.user.pk:
             raise Http404()
 
-        if current_user_membership.role != 'owner' and obj.role == 'owner':
+        if current_user_role != 'owner' and obj.role == 'owner':
             raise Http404()
 
         self.vault = obj.vault
         return obj
 
+    def delete(self, request, *args, **kwargs):
+        try:
+            return super().delete(request, *args, **kwargs)
+        except ConcurrentUpdateError:
+            return HttpResponse(
+                CONFLICT_MESSAGE, status=409, content_type='text/plain'
+            )
+
 
 class MembershipUpdateView(mixins.LoginRequiredMixin, UpdateView):
     ''' Updates an existing membership '''
@@ -116,3 +134,48 @@ class MembershipUpdateView(mixins.LoginRequiredMixin, UpdateView):
             raise Http404()
 
         return membership
+
+    def form_valid(self, form):
+        try:
+            return super().form_valid(form)
+        except ConcurrentUpdateError:
+            form.add_error(None, CONFLICT_MESSAGE)
+            return self.form_invalid(form)
+
+
+class MembershipBulkUpdateView(mixins.LoginRequiredMixin, FormView):
+    ''' Updates the role of several memberships of a vault at once '''
+    form_class = forms.BulkUpdateMembershipForm
+    template_name = 'crypta/membership/bulk_update.' + \
+        settings.TEMPLATE_EXTENSION
+
+    def get_success_url(self):
+        return reverse_lazy('membership:by-vault', args=[self.vault.slug])
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['vault'] = self.vault
+        return context
+
+    def get_form_kwargs(self):
+        self.vault = get_object_or_404(
+            models.Vault.objects.active().managed_by(self.request.user),
+            slug=self.kwargs.get('slug', None),
+        )
+        kwargs = super().get_form_kwargs()
+        kwargs['user'] = self.request.user
+        kwargs['vault'] = self.vault
+        kwargs['memberships'] = models.Membership.objects.active().filter(
+            vault=self.vault
+        ).exclude(
+            member=self.request.user
+        ).select_related('member', 'vault').order_by('joined_on')
+        return kwargs
+
+    def form_valid(self, form):
+        try:
+            form.save()
+        except ConcurrentUpdateError:
+            form.add_error(None, CONFLICT_MESSAGE)
+            return self.form_invalid(form)
+        return HttpResponseRedirect(self.get_success_url())
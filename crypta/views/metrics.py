@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django-Crypta.
+#
+# Django-Crypta is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Django-Crypta is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
+
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+from django.views.generic import View
+
+from crypta.conf import settings
+from crypta.utils.metrics import is_enabled, registry
+
+
+class MetricsView(View):
+    ''' Exports the collected metrics in the Prometheus text format '''
+    http_method_names = ['get']
+    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def has_access(self, request):
+        if settings.METRICS_TOKEN:
+            return constant_time_compare(
+                request.META.get('HTTP_AUTHORIZATION', ''),
+                'Bearer {}'.format(settings.METRICS_TOKEN),
+            )
+        return request.user.is_authenticated and request.user.is_staff
+
+    def get(self, request, *args, **kwargs):
+        if not is_enabled() or not self.has_access(request):
+            raise Http404()
+
+        return HttpResponse(
+            registry.export_text(), content_type=self.content_type
+        )
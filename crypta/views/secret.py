@@ -16,10 +16,11 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
 
-from django.http import Http404
+from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404
-from django.views.generic import (CreateView, DetailView, FormView, UpdateView,
-                                  DeleteView)
+from django.utils.translation import gettext_lazy as _
+from django.views.generic import (CreateView, DetailView, FormView, ListView,
+                                  UpdateView, DeleteView)
 
 try:  # pragma: no cover
     from django.core.urlresolvers import reverse_lazy
@@ -30,6 +31,7 @@ from crypta import forms, models
 from crypta.utils import crypt, tokens
 from crypta.mixins import views as mixins
 from crypta.mixins.forms import PasswordConfirmFormMixin
+from crypta.mixins.models import ConcurrentUpdateError
 from crypta.conf import settings
 
 
@@ -44,7 +46,9 @@ class SecretCreateView(mixins.LoginRequiredMixin, CreateView):
 
     def get_initial(self):
         self.vault = get_object_or_404(
-            models.Vault.objects.active().with_member(self.request.user),
+            models.Vault.objects.active().with_member(
+                self.request.user
+            ).with_keys(),
             slug=self.kwargs['slug'],
         )
         initial = super().get_initial()
@@ -56,16 +60,19 @@ class SecretCreateView(mixins.LoginRequiredMixin, CreateView):
         return kwargs
 
 
-class SecretDetailView(mixins.LoginRequiredMixin, FormView, DetailView):
+class SecretDetailView(mixins.LoginRequiredMixin, mixins.CryptoThrottleMixin,
+                       mixins.KeyringMixin, FormView, DetailView):
     ''' Show a secret details. '''
+    throttle_cost = 1  # Unlocks the membership key
     template_name = 'crypta/secret/detail.' + settings.TEMPLATE_EXTENSION
     model = models.Secret
     form_class = PasswordConfirmFormMixin
 
     def get_object(self, queryset=None):
         return get_object_or_404(
-            self.model.objects.select_related('vault'),
-            vault__members=self.request.user,
+            self.model.objects.from_vault_with_member(
+                self.request.user
+            ).select_related('vault').with_data(),
             pk=self.kwargs.get('pk', None),
         )
 
@@ -73,24 +80,35 @@ class SecretDetailView(mixins.LoginRequiredMixin, FormView, DetailView):
         self.object = self.get_object()
         kwargs = super().get_form_kwargs()
         kwargs['user'] = self.request.user
+        if self.request.method == 'POST':
+            membership = models.Membership.objects.with_keys().get(
+                member=self.request.user,
+                vault=self.object.vault
+            )
+            kwargs['private_key'] = membership.priv_key
         return kwargs
 
     def form_valid(self, form):
         context = self.get_context_data(object=self.object)
+        if form.unlocked_key is not None:
+            context['clear_text_secret'] = crypt.decrypt_with_key(
+                form.unlocked_key, self.object.data
+            )
+        else:
+            context['clear_text_secret'] = crypt.decrypt(
+                form.private_key, form.cleaned_data['password'],
+                self.object.data,
+            )
+        # Older ciphertexts are moved to the current format as they're read,
+        # before the token is issued since it covers the ciphertext digest.
+        self.object.upgrade_data(context['clear_text_secret'])
+
         token = tokens.secret_update_token_generator.make_token(
             self.object, self.request.user
         )
         context['update_url'] = reverse_lazy(
             'secret:update', args=[self.object.pk, token]
         )
-        context['clear_text_secret'] = crypt.decrypt(
-            models.Membership.objects.get(
-                member=self.request.user,
-                vault=self.object.vault
-            ).priv_key,
-            form.cleaned_data['password'],
-            self.object.data,
-        )
         return self.render_to_response(context)
 
 
@@ -105,9 +123,9 @@ class SecretUpdateView(mixins.LoginRequiredMixin, UpdateView):
 
     def get_object(self, queryset=None):
         secret = get_object_or_404(
-            self.model.objects.select_related('vault'),
-            vault__members=self.request.user,
-            vault__membership__role__in=('admin', 'owner'),
+            self.model.objects.from_vault_managed_by(
+                self.request.user
+            ).select_related('vault'),
             pk=self.kwargs.get('pk', None),
         )
         valid_token = tokens.secret_update_token_generator.check_token(
@@ -117,6 +135,16 @@ class SecretUpdateView(mixins.LoginRequiredMixin, UpdateView):
             raise Http404()
         return secret
 
+    def form_valid(self, form):
+        try:
+            return super().form_valid(form)
+        except ConcurrentUpdateError:
+            return HttpResponse(
+                _("Sorry, but this secret was changed by someone else "
+                  "meanwhile. Please, reload it and try again."),
+                status=409, content_type='text/plain',
+            )
+
 
 class SecretDeleteView(mixins.LoginRequiredMixin, DeleteView):
     ''' Deletes a secret '''
@@ -128,10 +156,46 @@ class SecretDeleteView(mixins.LoginRequiredMixin, DeleteView):
 
     def get_object(self, queryset=None):
         obj = get_object_or_404(
-            self.model.objects.select_related('vault'),
-            vault__members=self.request.user,
-            vault__membership__role__in=('admin', 'owner'),
+            self.model.objects.from_vault_managed_by(
+                self.request.user
+            ).select_related('vault'),
             pk=self.kwargs.get('pk', None),
         )
         self.vault = obj.vault
         return obj
+
+
+class SecretSearchView(mixins.LoginRequiredMixin, ListView):
+    ''' Searches secrets by name in one or all of the user's vaults '''
+    model = models.Secret
+    paginate_by = settings.SECRET_PAGE_SIZE
+    template_name = 'crypta/secret/search.' + settings.TEMPLATE_EXTENSION
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['vault'] = self.vault
+        context['query'] = self.query
+        return context
+
+    def get_queryset(self):
+        self.query = self.request.GET.get('q', '').strip()
+        self.vault = None
+        vaults = models.Vault.objects.active().with_member(self.request.user)
+        if 'slug' in self.kwargs:
+            self.vault = get_object_or_404(vaults, slug=self.kwargs['slug'])
+
+        if not self.query:
+            return self.model.objects.none()
+
+        # Keeps the token lookups within the user's vaults instead of
+        # scanning every vault's tokens for each term
+        if self.vault is not None:
+            vault_ids = [self.vault.pk]
+        else:
+            vault_ids = list(vaults.values_list('pk', flat=True))
+
+        return self.model.objects.filter(vault_id__in=vault_ids).search(
+            self.query, vaults=vault_ids
+        ).select_related('vault').only(
+            'id', 'name', 'vault__name', 'vault__slug'
+        ).order_by('name', 'pk')
@@ -17,7 +17,7 @@
 # along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
 
 from django.db import transaction
-from django.http import HttpResponseRedirect
+from django.http import Http404, HttpResponseRedirect
 from django.shortcuts import get_object_or_404
 from django.views.generic import (CreateView, DeleteView, DetailView, ListView,
                                   UpdateView, View)
@@ -25,6 +25,7 @@ from django.views.generic import (CreateView, DeleteView, DetailView, ListView,
 from crypta import forms, models
 from crypta.mixins import views as mixins
 from crypta.conf import settings
+from crypta.utils.pagination import KeysetPaginator
 
 try:  # pragma: no cover
     from django.core.urlresolvers import reverse_lazy
@@ -32,22 +33,31 @@ except ImportError:  # pragma: no cover
     from django.urls import reverse_lazy
 
 
-class VaultListView(mixins.LoginRequiredMixin, ListView):
+class VaultListView(mixins.LoginRequiredMixin, mixins.VaultETagMixin,
+                    ListView):
     "List all Vaults that has `request.user` as a member."
     model = models.Vault
     template_name = 'crypta/vault/index.' + settings.TEMPLATE_EXTENSION
+    etag_allow_empty = True
+
+    def get_etag_queryset(self):
+        return self.get_queryset()
 
     def get_queryset(self):
         self.queryset = self.model.objects
         if int(self.request.GET.get('excluded', '0')) == 0:
             self.queryset = self.queryset.active()
 
-        self.queryset = self.queryset.with_member(self.request.user)
+        self.queryset = self.queryset.with_member(
+            self.request.user
+        ).with_owners()
         return super().get_queryset()
 
 
-class VaultCreateView(mixins.LoginRequiredMixin, CreateView):
+class VaultCreateView(mixins.LoginRequiredMixin, mixins.CryptoThrottleMixin,
+                      mixins.KeyringMixin, CreateView):
     "Create a new Vault and add the current user as Owner."
+    throttle_cost = 3  # Generates an RSA key pair and locks it
     model = models.Vault
     form_class = forms.CreateVaultForm
     template_name = 'crypta/vault/create.' + settings.TEMPLATE_EXTENSION
@@ -72,22 +82,49 @@ class VaultCreateView(mixins.LoginRequiredMixin, CreateView):
         return HttpResponseRedirect(self.get_success_url())
 
 
-class VaultDetailView(mixins.LoginRequiredMixin, DetailView):
+class VaultDetailView(mixins.LoginRequiredMixin, mixins.VaultETagMixin,
+                      DetailView):
     "Show the Vault details for all members"
     template_name = 'crypta/vault/detail.' + settings.TEMPLATE_EXTENSION
     model = models.Vault
 
+    def get_etag_queryset(self):
+        return self.model.objects.active().with_member(
+            self.request.user
+        ).filter(slug=self.kwargs.get('slug', None))
+
     def get_object(self, queryset=None):
-        # TODO: Verificar prefetch
         return get_object_or_404(
             self.model.objects.active().with_member(
                 self.request.user
-            ).prefetch_related(
-                'members', 'memberships', 'secrets'
-            ),
+            ).prefetch_related('memberships__member'),
             slug=self.kwargs.get('slug', None),
         )
 
+    def get_secrets_queryset(self, query):
+        queryset = self.object.secrets.only('id', 'name', 'vault_id')
+        if query:
+            queryset = queryset.search(query, vault=self.object)
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.request.GET.get('q', '').strip()
+        context['order'] = self.request.GET.get('order', 'name')
+        paginator = KeysetPaginator(
+            self.get_secrets_queryset(context['query']),
+            settings.SECRET_PAGE_SIZE,
+            descending=context['order'] == '-name',
+        )
+        try:
+            context['secrets_page'] = paginator.page(
+                after=self.request.GET.get('after'),
+                before=self.request.GET.get('before'),
+            )
+        except ValueError:
+            raise Http404("Invalid page cursor")
+        return context
+
 
 class VaultDeleteView(mixins.LoginRequiredMixin, DeleteView):
     "Allow the Owner to delete a Vault"
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django-Crypta.
+#
+# Django-Crypta is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Django-Crypta is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
+
+import random
+import time
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from crypta import models
+
+try:  # pragma: no cover
+    from django.core.urlresolvers import reverse
+except ImportError:  # pragma: no cover
+    from django.urls import reverse
+
+User = get_user_model()
+
+# (endpoint, weight) of the replayed traffic, roughly what dashboards and
+# people browsing vaults generate.
+TRAFFIC_MIX = (
+    ('vault:list', 30),
+    ('vault:detail', 30),
+    ('membership:by-vault', 10),
+    ('invite:by-vault', 5),
+    ('secret:detail', 15),
+    ('secret:reveal', 10),
+)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = max(0, int(round(pct / 100 * len(ordered))) - 1)
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = 'Replays a traffic mix against the crypta views and reports ' \
+        'latency percentiles and throughput per endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--users', type=int, default=20,
+                            help='How many seeded users send traffic')
+        parser.add_argument('--password', default='password')
+        parser.add_argument('--prefix', default='seed')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def get_clients(self, options):
+        users = list(User.objects.filter(
+            username__startswith=options['prefix'], membership__isnull=False
+        ).distinct()[:options['users']])
+        if not users:
+            raise CommandError(
+                "No seeded users found, run 'seeddemodata' first."
+            )
+
+        clients = []
+        for (i, user) in enumerate(users):
+            # Each user on an address of its own, as real traffic would be,
+            # instead of all of them sharing one throttle IP bucket.
+            address = '10.0.{}.{}'.format(i // 250, i % 250 + 1)
+            client = Client(REMOTE_ADDR=address)
+            client.login(username=user.username, password=options['password'])
+            memberships = list(user.memberships.select_related('vault'))
+            secrets = list(models.Secret.objects.filter(
+                vault__membership__member=user
+            ).values_list('pk', flat=True)[:50])
+            clients.append((client, memberships, secrets))
+        return clients
+
+    def build_request(self, endpoint, memberships, secrets, password):
+        membership = random.choice(memberships)
+        slug = membership.vault.slug
+        if endpoint == 'vault:list':
+            return ('get', reverse(endpoint), None)
+        if endpoint == 'vault:detail':
+            return ('get', reverse(endpoint, args=[slug]), None)
+        if endpoint in ('membership:by-vault', 'invite:by-vault'):
+            # Memberships are listed to managers and invites to owners only,
+            # everybody else falls back to the vault page.
+            allowed = ('owner',)
+            if endpoint == 'membership:by-vault':
+                allowed = ('owner', 'admin')
+            if membership.role not in allowed:
+                return ('get', reverse('vault:detail', args=[slug]), None)
+            return ('get', reverse(endpoint, args=[slug]), None)
+        if not secrets:
+            return ('get', reverse('vault:detail', args=[slug]), None)
+        url = reverse('secret:detail', args=[random.choice(secrets)])
+        if endpoint == 'secret:reveal':
+            return ('post', url, {'password': password})
+        return ('get', url, None)
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        clients = self.get_clients(options)
+        endpoints = [e for (e, weight) in TRAFFIC_MIX for _ in range(weight)]
+
+        timings = defaultdict(list)
+        errors = defaultdict(int)
+        started = time.perf_counter()
+        for _ in range(options['requests']):
+            endpoint = random.choice(endpoints)
+            client, memberships, secrets = random.choice(clients)
+            method, url, data = self.build_request(
+                endpoint, memberships, secrets, options['password']
+            )
+
+            start = time.perf_counter()
+            response = getattr(client, method)(url, data or {})
+            timings[endpoint].append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors[endpoint] += 1
+        elapsed = time.perf_counter() - started
+
+        row = '{:<22} {:>7} {:>7} {:>9} {:>9} {:>9} {:>9}'
+        self.stdout.write(row.format(
+            'endpoint', 'count', 'errors', 'p50 ms', 'p95 ms', 'p99 ms',
+            'req/s'
+        ))
+        for (endpoint, values) in sorted(timings.items()):
+            self.stdout.write(row.format(
+                endpoint, len(values), errors[endpoint],
+                '{:.1f}'.format(percentile(values, 50) * 1000),
+                '{:.1f}'.format(percentile(values, 95) * 1000),
+                '{:.1f}'.format(percentile(values, 99) * 1000),
+                # Share of the whole run's throughput, not 1 / mean latency
+                '{:.1f}'.format(len(values) / elapsed),
+            ))
+        self.stdout.write('Total: {} requests in {:.1f}s ({:.1f} req/s)'.format(
+            options['requests'], elapsed, options['requests'] / elapsed
+        ))
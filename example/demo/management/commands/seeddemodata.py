@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django-Crypta.
+#
+# Django-Crypta is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Django-Crypta is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
+
+import itertools
+import json
+import random
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from crypta import models
+from crypta.utils import crypt, tokens
+
+User = get_user_model()
+
+SAMPLE_SECRETS = [
+    {'username': 'root', 'password': 'hunter2'},
+    {'url': 'https://db.example.com', 'user': 'app', 'password': 's3cr3t'},
+    {'kubeconfig': 'apiVersion: v1\nkind: Config\n' * 40},
+]
+
+
+class Command(BaseCommand):
+    help = 'Seeds the example site with users, vaults, secrets and invites'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--vaults', type=int, default=3,
+                            help='Vaults owned by each user')
+        parser.add_argument('--fanout', type=int, default=5,
+                            help='Extra members on each vault')
+        parser.add_argument('--secrets', type=int, default=10,
+                            help='Secrets on each vault')
+        parser.add_argument('--invites', type=int, default=2,
+                            help='Pending invites on each vault')
+        parser.add_argument('--keys', type=int, default=4,
+                            help='Key pairs generated and shared by vaults')
+        parser.add_argument('--password', default='password')
+        parser.add_argument('--prefix', default='seed')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def gen_key_cache(self, size, password):
+        # RSA key generation and the PEM KDF dominate seeding, so a few key
+        # pairs (and their secrets and invite keys) are made up front and
+        # shared by every vault.
+        token = tokens.random_token()
+        cache = []
+        for _ in range(size):
+            priv_key, pub_key = crypt.gen_keys(password)
+            cache.append({
+                'priv_key': priv_key,
+                'pub_key': pub_key,
+                'token': token,
+                'temporary_key': crypt.change_password(
+                    priv_key, password, token
+                ),
+                'secrets': [
+                    crypt.encrypt(pub_key, json.dumps(secret))
+                    for secret in SAMPLE_SECRETS
+                ],
+            })
+        return cache
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        password = options['password']
+        batch_size = options['batch_size']
+        key_cache = self.gen_key_cache(options['keys'], password)
+
+        hashed_password = make_password(password)
+        User.objects.bulk_create([
+            User(
+                username='{}{}'.format(prefix, i),
+                email='{}{}@example.com'.format(prefix, i),
+                first_name='{}{}'.format(prefix.title(), i),
+                password=hashed_password,
+            )
+            for i in range(options['users'])
+        ], batch_size=batch_size)
+        users = list(User.objects.filter(username__startswith=prefix))
+
+        vault_keys = {}
+        vaults = []
+        for (i, (owner, j)) in enumerate(itertools.product(
+                users, range(options['vaults']))):
+            keys = key_cache[i % len(key_cache)]
+            slug = '{}-{}-{}'.format(prefix, owner.pk, j)
+            vault_keys[slug] = (owner, keys)
+            vaults.append(models.Vault(
+                name='{} vault {}'.format(owner.first_name, j),
+                slug=slug, pub_key=keys['pub_key'],
+            ))
+        models.Vault.objects.bulk_create(vaults, batch_size=batch_size)
+        vaults = models.Vault.objects.filter(slug__in=vault_keys.keys())
+
+        memberships, secrets, invites = [], [], []
+        for vault in vaults:
+            owner, keys = vault_keys[vault.slug]
+            others = random.sample(
+                [u for u in users if u != owner],
+                min(len(users) - 1, options['fanout'] + options['invites'])
+            )
+            members = others[:options['fanout']]
+            invitees = others[options['fanout']:]
+
+            memberships.append(models.Membership(
+                member=owner, vault=vault, role='owner',
+                priv_key=keys['priv_key'],
+            ))
+            memberships.extend(
+                models.Membership(
+                    member=member, vault=vault,
+                    role=random.choice(('admin', 'member', 'member')),
+                    priv_key=keys['priv_key'],
+                )
+                for member in members
+            )
+            for k in range(options['secrets']):
+                data = keys['secrets'][k % len(keys['secrets'])]
+                secrets.append(models.Secret(
+                    vault=vault, name='secret-{}'.format(k), data=data,
+                    data_digest=crypt.digest(data),
+                ))
+            invites.extend(
+                models.Invite(
+                    inviter=owner, invitee=invitee, vault=vault,
+                    role='member', temporary_key=keys['temporary_key'],
+                )
+                for invitee in invitees
+            )
+
+        models.Membership.objects.bulk_create(
+            memberships, batch_size=batch_size
+        )
+        models.Secret.objects.bulk_create(secrets, batch_size=batch_size)
+        models.SecretToken.objects.index(secrets, batch_size=batch_size)
+        models.Invite.objects.bulk_create(invites, batch_size=batch_size)
+
+        self.stdout.write(self.style.SUCCESS(
+            'Created {} users, {} vaults, {} memberships, {} secrets and {} '
+            'invites. Invite token: {}'.format(
+                len(users), len(vault_keys), len(memberships), len(secrets),
+                len(invites), key_cache[0]['token'].decode(),
+            )
+        ))
@@ -16,14 +16,26 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
 
+from functools import partial
+
 from django.contrib import admin
 from django.contrib.auth import views as auth_views
 from django.views.generic.base import TemplateView
 
+from crypta.forms import PasswordChangeForm
+
 try:
     login = auth_views.LoginView.as_view()
+    password_change = auth_views.PasswordChangeView.as_view(
+        form_class=PasswordChangeForm, success_url='/accounts/profile/'
+    )
 except AttributeError:
     login = auth_views.login
+    password_change = partial(
+        auth_views.password_change,
+        password_change_form=PasswordChangeForm,
+        post_change_redirect='/accounts/profile/',
+    )
 
 try:
     from django.conf.urls import url, include
@@ -37,6 +49,7 @@ urlpatterns = [
     url(r'^accounts/profile/$',
         TemplateView.as_view(template_name='profile.html'), name="profile"),
     url(r'^accounts/login/$', login, name='login'),
+    url(r'^accounts/password/$', password_change, name='password_change'),
     url(r'^accounts/logout/$', auth_views.logout, {'next_page': '/'}, name='logout'),
     url(r'^crypta/', include('crypta.urls')),
     url(r'^admin/', admin.site.urls),
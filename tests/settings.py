@@ -16,6 +16,9 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
+import tempfile
+
 import django
 
 SECRET_KEY = 'awesome-secret'
@@ -29,6 +32,23 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': ':memory:',
+    },
+    # Used by the replica routing tests. A file keeps it apart from the
+    # in-memory default, which would share its cache (and locks) with it.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(tempfile.gettempdir(), 'crypta-replica.sqlite3'),
+        'TEST': {
+            'NAME': os.path.join(
+                tempfile.gettempdir(), 'test-crypta-replica.sqlite3'
+            ),
+        },
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django-Crypta.
+#
+# Django-Crypta is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Django-Crypta is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import skipIf
+
+from django.test import SimpleTestCase
+
+from crypta.adapters import JsonSecretAdapter
+from crypta.utils.testing import ImportBudgetTestMixin
+
+try:
+    import jsonschema
+except ImportError:  # pragma: no cover
+    jsonschema = None
+
+
+class ImportBudgetTestCase(ImportBudgetTestMixin, SimpleTestCase):
+    def test_urls_import_budget(self):
+        self.assertImportBudget('crypta.urls')
+
+    def test_adapters_import_lazily(self):
+        self.assertImportBudget('crypta.adapters')
+
+
+class JsonSecretAdapterTestCase(SimpleTestCase):
+    def test_parse(self):
+        self.assertEqual(JsonSecretAdapter.load('{"a": [1, 2]}'),
+                         {'a': [1, 2]})
+        self.assertFalse(JsonSecretAdapter.validate('{"a": '))
+
+    @skipIf(jsonschema is None, 'jsonschema is not installed')
+    def test_schema(self):
+        class Adapter(JsonSecretAdapter):
+            schema = {'type': 'object', 'required': ['user']}
+
+        self.assertEqual(Adapter.load('{"user": "a"}'), {'user': 'a'})
+        with self.assertRaises(ValueError):
+            Adapter.load('{"password": "a"}')
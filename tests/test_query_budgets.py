@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django-Crypta.
+#
+# Django-Crypta is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Django-Crypta is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.urls import reverse
+from django.test import TestCase
+
+from crypta import models
+from crypta.conf import settings
+from crypta.utils.testing import QueryBudgetTestMixin
+
+User = get_user_model()
+
+
+class QueryBudgetTestCase(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(type(settings), 'THROTTLE_BUDGET', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.owner = User.objects.create_user('owner', 'o@x.com', 'pw')
+        self.member = User.objects.create_user('member', 'm@x.com', 'pw')
+        self.invitee = User.objects.create_user('invitee', 'i@x.com', 'pw')
+        self.client.login(username='owner', password='pw')
+
+        self.client.post(reverse('vault:create'), {
+            'name': 'Vault', 'slug': '', 'password': 'pw',
+        })
+        self.vault = models.Vault.objects.get(name='Vault')
+        self.client.post(reverse('secret:create', args=[self.vault.slug]), {
+            'name': 'Secret', 'data': '{"a": 1}',
+        })
+        self.secret = models.Secret.objects.get(name='Secret')
+
+        self.invite(self.member)
+        self.client.logout()
+        self.client.login(username='member', password='pw')
+        self.client.post(reverse('invite:accept', args=[self.invite_obj.pk]), {
+            'token': self.token, 'password': 'pw',
+        })
+        self.client.logout()
+        self.client.login(username='owner', password='pw')
+        self.invite(self.invitee)
+
+        self.scale = 0
+
+    def invite(self, user):
+        self.client.post(reverse('invite:create', args=[self.vault.slug]), {
+            'invitee': user.pk, 'role': 'admin', 'password': 'pw',
+        })
+        self.invite_obj = models.Invite.objects.get(invitee=user)
+        self.token = re.search('[0-9a-f]{32}', mail.outbox[-1].body).group(0)
+
+    def populate(self, scale):
+        ''' Grows every list to `scale` rows, keys aren't used by GETs '''
+        while self.scale < scale:
+            self.scale += 1
+            user = User.objects.create_user('user{}'.format(self.scale))
+            models.Membership.objects.create(
+                member=user, vault=self.vault, role='member', priv_key=b'key'
+            )
+            models.Invite(
+                vault=self.vault, inviter=self.owner, invitee=user,
+                role='member',
+            ).save()
+            models.Secret.objects.create(
+                vault=self.vault, name='Secret {}'.format(self.scale),
+                data=b'data',
+            )
+            vault = models.Vault.objects.create(
+                name='Vault {}'.format(self.scale), pub_key=b'key'
+            )
+            models.Membership.objects.create(
+                member=self.owner, vault=vault, role='owner', priv_key=b'key'
+            )
+
+    def test_vault_list_doesnt_scale(self):
+        self.assertQueriesDontScale(reverse('vault:list'), self.populate)
+
+    def test_vault_detail_doesnt_scale(self):
+        self.assertQueriesDontScale(
+            reverse('vault:detail', args=[self.vault.slug]), self.populate
+        )
+
+    def test_membership_list_doesnt_scale(self):
+        self.assertQueriesDontScale(
+            reverse('membership:by-vault', args=[self.vault.slug]),
+            self.populate,
+        )
+
+    def test_invite_list_doesnt_scale(self):
+        self.assertQueriesDontScale(
+            reverse('invite:by-vault', args=[self.vault.slug]), self.populate
+        )
+
+    def test_secret_search_doesnt_scale(self):
+        self.assertQueriesDontScale(
+            reverse('secret:search'), self.populate, data={'q': 'secret'}
+        )
+
+    def test_budgets(self):
+        slug = self.vault.slug
+        membership = models.Membership.objects.get(member=self.member)
+        invite = self.invite_obj
+        tested = []
+
+        def check(name, args=(), method='get', data=None, status=200):
+            response = self.assertQueryBudget(
+                reverse(name, args=args), method=method, data=data
+            )
+            self.assertEqual(response.status_code, status, name)
+            tested.append(name)
+            return response
+
+        check('vault:list')
+        check('vault:create')
+        check('vault:detail', [slug])
+        check('vault:update', [slug])
+        check('secret:create', [slug])
+        check('secret:search', data={'q': 'secret'})
+        check('secret:search-vault', [slug], data={'q': 'secret'})
+        check('secret:detail', [self.secret.pk])
+        response = check('secret:detail', [self.secret.pk], 'post',
+                         {'password': 'pw'})
+        update_url = response.context['update_url']
+        self.assertQueryBudget(update_url, method='post',
+                               data={'data': '{"a": 2}'})
+        tested.append('secret:update')
+        check('membership:by-vault', [slug])
+        check('membership:bulk-update', [slug])
+        check('membership:update', [membership.pk])
+        check('invite:by-vault', [slug])
+        check('invite:create', [slug])
+        check('invite:resend', [invite.pk])
+        check('invite:renew', method='post', data={'pk': invite.pk},
+              status=302)
+        check('invite:revoke', method='post', data={'pk': invite.pk},
+              status=302)
+        check('membership:delete', method='post',
+              data={'pk': membership.pk}, status=302)
+        check('secret:delete', [self.secret.pk], 'post', status=302)
+        check('vault:delete', method='post', data={'pk': self.vault.pk},
+              status=302)
+        check('vault:restore', method='post', data={'pk': self.vault.pk},
+              status=302)
+        check('metrics:export', status=404)
+
+        self.invite(self.invitee)
+        self.client.logout()
+        self.client.login(username='invitee', password='pw')
+        check('invite:accept', [self.invite_obj.pk])
+
+        self.assertBudgetsCoverUrls(tested)
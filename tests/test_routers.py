@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django-Crypta.
+#
+# Django-Crypta is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Django-Crypta is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock, skipIf
+
+from django.db import connections, router
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from crypta import models, routers
+from crypta.conf import settings
+from crypta.middleware import ReplicaPinningMiddleware
+from crypta.utils.metrics import QueryCounter
+
+try:
+    import contextvars
+except ImportError:  # pragma: no cover
+    contextvars = None
+
+
+@override_settings(DATABASE_ROUTERS=['crypta.routers.ReplicaRouter'])
+class ReplicaRouterTestCase(TestCase):
+    multi_db = True
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        patcher = mock.patch.object(
+            type(settings), 'REPLICA_DATABASE', 'replica'
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(routers.reset_state)
+        routers.reset_state()
+        self.factory = RequestFactory()
+
+    def get_middleware(self):
+        return ReplicaPinningMiddleware(lambda request: None)
+
+    def request(self, method, session):
+        request = getattr(self.factory, method)('/crypta/')
+        request.session = session
+        self.get_middleware().process_request(request)
+        return request
+
+    def count_queries(self, func):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            func()
+        return len(primary.captured_queries), len(replica.captured_queries)
+
+    def read(self):
+        return list(models.Vault.objects.all())
+
+    def write(self):
+        return models.Vault.objects.create(name='Vault', pub_key=b'key')
+
+    def test_reads_go_to_the_replica(self):
+        self.request('get', {})
+        self.assertEqual(self.count_queries(self.read), (0, 1))
+
+    def test_replica_reads_are_counted(self):
+        self.request('get', {})
+        with QueryCounter() as queries:
+            self.read()
+        self.assertEqual(queries.count, 1)
+
+        with QueryCounter('default') as queries:
+            self.read()
+        self.assertEqual(queries.count, 0)
+
+    def test_writes_go_to_the_primary(self):
+        self.request('post', {})
+        primary, replica = self.count_queries(self.write)
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+        self.assertTrue(routers.has_written())
+
+    def test_unsafe_requests_read_from_the_primary(self):
+        self.request('post', {})
+        self.assertEqual(self.count_queries(self.read), (1, 0))
+
+    def test_writes_pin_the_session(self):
+        session = {}
+        request = self.request('post', session)
+        self.write()
+        self.get_middleware().process_response(request, None)
+        self.assertGreater(
+            session[ReplicaPinningMiddleware.session_key], time.time()
+        )
+
+        self.request('get', session)
+        self.assertEqual(self.count_queries(self.read), (1, 0))
+
+    def test_pins_expire(self):
+        session = {ReplicaPinningMiddleware.session_key: time.time() - 1}
+        self.request('get', session)
+        self.assertEqual(self.count_queries(self.read), (0, 1))
+
+    def test_reads_without_writes_do_not_pin(self):
+        session = {}
+        request = self.request('get', session)
+        self.read()
+        self.get_middleware().process_response(request, None)
+        self.assertNotIn(ReplicaPinningMiddleware.session_key, session)
+
+    @skipIf(contextvars is None, "Python < 3.7")
+    def test_state_follows_the_context_into_executors(self):
+        self.request('get', {})
+        routers.pin_to_primary()
+        context = contextvars.copy_context()
+
+        def work():
+            router.db_for_write(models.Vault)
+            return routers.is_pinned()
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pinned = executor.submit(context.run, work).result()
+        self.assertTrue(pinned)
+        self.assertTrue(routers.has_written())
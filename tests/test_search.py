@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of Django-Crypta.
+#
+# Django-Crypta is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Django-Crypta is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Django-Crypta.  If not, see <http://www.gnu.org/licenses/>.
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from crypta import models
+
+
+class SecretIndexTestCase(TestCase):
+    def setUp(self):
+        vault = models.Vault.objects.create(name='Vault', pub_key=b'key')
+        secret = models.Secret.objects.create(
+            vault=vault, name='Github token', data=b'data'
+        )
+        self.secret = models.Secret.objects.get(pk=secret.pk)
+
+    def get_tokens(self):
+        return list(models.SecretToken.objects.filter(
+            secret=self.secret
+        ).order_by('token').values_list('pk', 'token'))
+
+    def test_creation_indexes_the_name(self):
+        self.assertEqual([t for (pk, t) in self.get_tokens()],
+                         ['github', 'token'])
+
+    def test_data_updates_keep_the_tokens(self):
+        tokens = self.get_tokens()
+        self.secret.data = b'new data'
+        with CaptureQueriesContext(connection) as queries:
+            self.secret.save()
+
+        self.assertEqual(self.get_tokens(), tokens)
+        self.assertFalse([
+            q for q in queries.captured_queries
+            if 'crypta_secrettoken' in q['sql']
+        ])
+
+    def test_renames_rebuild_the_tokens(self):
+        self.secret.name = 'Gitlab token'
+        self.secret.save()
+        self.assertEqual([t for (pk, t) in self.get_tokens()],
+                         ['gitlab', 'token'])
@@ -21,8 +21,10 @@ from django.views.generic.base import TemplateView
 
 try:
     login = auth_views.LoginView.as_view()
+    logout = auth_views.LogoutView.as_view()
 except AttributeError:
     login = auth_views.login
+    logout = auth_views.logout
 
 try:
     from django.conf.urls import url, include
@@ -31,8 +33,7 @@ except ImportError:
 
 urlpatterns = [
     url(r'^accounts/login/$', login, name='login'),
-    url(r'^accounts/logout/$',
-        auth_views.logout, {'next_page': '/'}, name='logout'),
+    url(r'^accounts/logout/$', logout, {'next_page': '/'}, name='logout'),
     url(r'^accounts/profile/$',
         TemplateView.as_view(template_name='profile.html'), name="profile"),
     url(r'^crypta/', include('crypta.urls')),